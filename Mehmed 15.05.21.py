@@ -22,7 +22,7 @@ from coded_message import*
 
 
 # ##  Section 1: Solving simple cyclic shifts
-# In the first message, we are told that the cipher is simply a cyclic shift of the 27 characters. E.g.  shift of 2 would map A → C, B → D, . . . , Y → space, Z → A, space → B. We therefore tackled the first message using a trial and error method, as the encryption used a simple Caesar cipher (shift) [1]. This involved trying the different possible shifts of the 27 characters and checking by hand whether any of the shifts produced readable texts in English. We found that by shifting each character 9 places to the left (I.e. J to A) allowed us to translate the message back. The decoded message is outputted below.
+# In the first message, we are told that the cipher is simply a cyclic shift of the 27 characters. E.g.  shift of 2 would map A → C, B → D, . . . , Y → space, Z → A, space → B. We therefore tackled the first message using a trial and error method, as the encryption used a simple Caesar cipher (shift) [1]. This involved trying the different possible shifts of the 27 characters and checking by hand whether any of the shifts produced readable texts in English. We found that by shifting each character 9 places to the left (I.e. J to A) allowed us to translate the message back. The decoded message is outputted below. (In Section 5 we find this shift automatically, by scoring every possible shift with our bigram plausibility score.)
 
 # In[3]:
 
@@ -65,20 +65,19 @@ with open('moby.txt','w',errors='ignore') as f:
     f.write(moby.upper()) # write to file
 
 
-# The re.sub function replaces any occurrences of any substrings [2]. The [ ] creates a list of characters and the ^ negates this list so that these characters are not replaced. The ' ' argument indicates what you want to replace the chosen charatcers with. In moby_exception we replace everything that isn't alphabetical or a hyphen or apostrophe with a white space. The second use of the re.sub function uses '', indicating we want the re.sub function to replace all the hyphens and apostrophes with nothing, effectively deleting them.
+# We first cleaned the text with two calls of the re.sub function, which replaces any occurrences of any substrings [2]: re.sub(r'[^A-Z\-\'"]+', ' ', moby) replaced everything that isn't alphabetical or a hyphen or apostrophe with a white space, and re.sub(r'[\-\'"]+', '', ...) then replaced all the hyphens and apostrophes with nothing, effectively deleting them. Each of these makes a new copy of the whole book, so the function normalize_codes in codebreaking/language_model.py now does the same clean up in a single pass over the bytes of the file: every byte is looked up in a table giving its position in our alphabet (upper and lower case letters alike), a space for anything else or a mark for hyphens and apostrophes, and then repeated spaces and the marks are dropped. The result is exactly the same text, stored as alphabet indexes.
 
 # In[5]:
 
 
-import re
+from codebreaking.language_model import normalize_codes, encode, decode
 
-# This code opens our pre-made text file and reads it into a string variable called moby
-with open('moby.txt','r',errors='ignore',encoding = 'utf-8') as f:
-    moby=f.read() 
-    
-# Here we deal with non alphabetical characters and those that aren't white spaces.
-moby_exception = re.sub(r'[^A-Z\-\'"]+', ' ', moby) 
-moby_alt = re.sub(r'[\-\'"]+','',moby_exception)
+# This code opens our pre-made text file and cleans it into an array of alphabet indexes
+with open('moby.txt','rb') as f:
+    moby_codes = normalize_codes(f.read())
+
+# The same text as a string
+moby_alt = decode(moby_codes)
 
 
 # In[6]:
@@ -91,31 +90,33 @@ print(moby_alt[:100]) # Change to print only first 100 characters in the string
 # ##  Section 3: Using character frequencies to solve coded messages
 # Now that we have our sample text downloaded and easy to access, we can try and analyse character frequencies. In Moby Dick and our coded message, we counted the frequency of each character, sorted them by frequency and then tried to cipher them according to how common they were. I.e. the most common character in Moby Dick mapped to the most common in our message. 
 
-# We have utilised Python's built-in function Counter [5] within our own function char_freq to analyse character frequencies. Our function creates two dictionaries, each has keys representing characters and values representing character frequencies. One dictionary corresponds to our large sample text, Herman Melville's Moby Dick and the other corresponds to the inputted string (in this case it is our coded message). 
-# After setting up the two dictionaries, we consider any characters not found in the inputted message and append them to the keys of the Decode dictionary, with corresponding frequency values of 0. We assumed that as our sample text is sufficiently large, all 27 characters would appear at least once.
-# Following this, we sort both dictionaries by their frequency values into ascending order. This will allow us to make direct comparisons between the frequencies and take an educated guess at which characters are code for which.
+# Our function char_freq analyses character frequencies. It creates two dictionaries, each has keys representing characters and values representing character frequencies. One dictionary corresponds to our large sample text, Herman Melville's Moby Dick and the other corresponds to the inputted string (in this case it is our coded message). 
+# We first counted the characters with Python's built-in function Counter [5] every time char_freq was called, including all of Moby Dick. Now the Moby Dick counts are worked out once with np.bincount from moby_codes, and the message is counted by frequency_order in codebreaking/solvers.py, which also uses np.bincount on the encoded message. Characters not found in the message are given a frequency of 0. We assumed that as our sample text is sufficiently large, all 27 characters would appear at least once.
+# Both dictionaries are sorted by their frequency values into ascending order, with characters of the same frequency in the message kept in the order they first appear, followed by the missing characters in alphabetical order, exactly as the Counter version did. This will allow us to make direct comparisons between the frequencies and take an educated guess at which characters are code for which.
 # Our function returns both ordered dictionaries.
 
 # In[7]:
 
 
-# This Python module is used to count the frequencies of characters
+# This Python module is used to count the frequencies of characters (bigram_freq in Section 5 still uses it)
 from collections import Counter
+import numpy as np
+
+from codebreaking.solvers import frequency_order
+
+# The character frequencies of Moby Dick never change, so they are counted once here rather than every time
+# char_freq is called. np.bincount counts how many times each alphabet index appears in moby_codes, and the
+# characters are then sorted by ascending frequency.
+moby_counts = np.bincount(moby_codes, minlength=len(alphabet))
+Sample = {alphabet[i]: int(moby_counts[i]) for i in np.argsort(moby_counts, kind='stable')}
 
 # Takes a string as input
 def char_freq(message):
-    
-    Sample = dict(Counter(moby_alt)) # Dictionary holding character frequency from large sample text
-    Decode= dict(Counter(message)) # Dictionary holding character frequency from coded message
-    
-    for letter in alphabet: # This deals with characters that do not appear in the message
-        if letter not in Decode:
-            Decode.update({letter :0})
-            
-    # This sorts the characters by ascending order by their values
-    Sample =  {k:v for k, v in sorted(Sample.items(), key=lambda x:x[1])}
-    Decode = {k:v for k, v in sorted(Decode.items(), key=lambda x:x[1])}
-    return Sample, Decode    
+    # frequency_order counts the characters of the encoded message with np.bincount and sorts them by ascending
+    # frequency, with the characters that do not appear in the message given a frequency of 0
+    order, counts = frequency_order(encode(message))
+    Decode = {alphabet[i]: int(counts[i]) for i in order} # Dictionary holding character frequency from coded message
+    return dict(Sample), Decode
 
 
 # In[8]:
@@ -138,17 +139,15 @@ def switch(message):
     return corresponding_char
 
 
-# Below is our first attempt at our function which will produce our decoded message. The function first_try creates a string called decoded_message, this will hold all the decoded characters in order. It assigns the outputted dictionary from our switch() function to the dictionary cipher [6]. Then for each character in the message, it finds it in the cipher keys, and appends the cipher value to the string. Eventually the for loop terminates and the function returns the decoded message.
+# Below is our first attempt at our function which will produce our decoded message. The function first_try assigns the outputted dictionary from our switch() function to the dictionary cipher [6]. Originally it then went through each character in the message, found it in the cipher keys and appended the cipher value to a string; now the cipher is turned into a translation table and applied to the whole message in one go with translate() [4], which returns the decoded message.
 
 # In[10]:
 
 
 def first_try(message):
-    decoded_message = ''
     cipher = switch(message)
-    for character in message:
-        decoded_message += (cipher[character]) # This appends each decoded character to the string
-    return decoded_message
+    # str.maketrans turns the cipher into a translation table, which translate() applies to every character at once
+    return message.translate(str.maketrans(cipher))
 
 
 # In[11]:
@@ -158,19 +157,42 @@ def first_try(message):
 print(first_try(message2))
 
 
+# In[ ]:
+
+
+from codebreaking.solvers import frequency_key
+
+# Our original Counter version of first_try, kept here to check the faster one against
+def counter_first_try(message):
+    Sample = dict(Counter(moby_alt))
+    Decode = dict(Counter(message))
+    for letter in alphabet:
+        if letter not in Decode:
+            Decode.update({letter: 0})
+    Sample = {k: v for k, v in sorted(Sample.items(), key=lambda x: x[1])}
+    Decode = {k: v for k, v in sorted(Decode.items(), key=lambda x: x[1])}
+    cipher = {k: v for k, v in zip(Decode.keys(), Sample.keys())}
+    return ''.join(cipher[character] for character in message)
+
+# Test cell: first_try and the frequency_key() used by the codebreaking package must decode every message exactly as
+# the Counter version did
+for message in (message1, message2, message3, message4, message5, message6, message7, message8, message9, message10,
+                message11, message12):
+    assert first_try(message) == counter_first_try(message)
+    codes = encode(message)
+    assert decode(frequency_key(codes, moby_counts)[codes]) == counter_first_try(message)
+
+
 # As you can see from the output above, our function first_try is far from perfect. When inputting the second decoded message, we receive an unreadable piece of text. This is because certain pairs of letters have similar frequencies , making our cipher dictionary inaccurate. Therefore, we need to find a way to interchange them when decoding.
 
 # ##  Section 4: Using a function to swap characters by trial and error.
-# We have created a function labelled swap() to help us correct the output from our function first_try. Swap() requires a sample text and 2 characters as input. It uses Python's built-in .replace() [4] function to replace any occurrences of the first character with the second, and vice versa. It does this by using an intermediate character !. As ! does not appear anywhere in the inputted text (see question 2 for our method for removing punctuation), we can replace the second inputted character (ch2) with !. Then we replace any instances of the first character (ch1) with ch2 in our message. And finally, we can replace all ! (originally all instances of ch2) with ch1. Our code then outputs the new message. This function allows us to adjust the cipher by hand until is readable and the message is decoded.
+# We have created a function labelled swap() to help us correct the output from our function first_try. Swap() requires a sample text and 2 characters as input. It replaces any occurrences of the first character with the second, and vice versa. We first did this with Python's built-in .replace() [4] function and an intermediate character !, which took three passes over the text and went wrong if the text ever contained a !. Now swap() builds a translation table which maps ch1 to ch2 and ch2 to ch1, and applies it with .translate() [4] in a single pass. Our code then outputs the new message. This function allows us to adjust the cipher by hand until is readable and the message is decoded.
 
 # In[12]:
 
 
 def swap(text, ch1, ch2):
-    text = text.replace(ch2, '!',) # Replaces ch2 with !
-    text = text.replace(ch1, ch2) # Replaces ch1 with ch2
-    text = text.replace('!', ch1) # Replaces ! with ch1
-    return text 
+    return text.translate(str.maketrans(ch1 + ch2, ch2 + ch1)) # Replaces ch1 with ch2 and ch2 with ch1
 
 
 # In[13]:
@@ -184,74 +206,58 @@ swap(test1,'a','g')
 # Now that we have a function that can swap any two characters, we can create a function which uses user input to hand adjust the output from our first_try function. Readable() uses while loops to ensure the user is inputting valid data (i.e. alphabetical characters or space character for swapping). It also allows the user to make as many swaps as they'd like, until they are satisfied with the readability of the decoded message. Within the function readable(), we use the swap function defined above to replace any instances of the first character with the second, and vice versa. the function then outputs the altered message, allowing the user to inspect the changes and make more swaps if necessary.
 
 # We have included a verbose parameter in our input for the function readable(). The verbose parameter if set to True will display all the intermediate versions of the decoded message, after each hand alteration. On the other hand, if verbose is set to False, it will keep asking for input of characters to swap, but will only display the final decoded message. 
+# Rather than swapping characters in a copy of the whole decoded message every time, readable() keeps the cipher as a CipherKey (from codebreaking/cipher_key.py), which only has to swap two entries, and decodes the message from the key when it needs to show it. A key can also be passed in, for example one saved with key.save() after decoding another message from the same sender; the swaps are then made to that key.
+# The key is held by a ReadableSession (from codebreaking/session.py), which can also be used without readable() when hand polishing from code. Besides the key it keeps the plausibility score of the decoded message (using the Moby Dick log matrix unless another model is passed in) and updates it with every swap, can undo and redo swaps, and can list the swaps that would improve the score the most. With verbose set to True these suggestions are shown after every swap.
 
 # In[49]:
 
 
-def readable(message,verbose = False):
-    updated_message = first_try(message) # This holds the rough attempt at translating the code
+from codebreaking.cipher_key import CipherKey
+from codebreaking.language_model import load_model
+from codebreaking.session import ReadableSession
+
+def readable(message,verbose = False,key = None,model = None):
+    if key is None:
+        key = CipherKey.from_dict(switch(message)) # This holds the cipher of our rough attempt at translating the code
+    if model is None:
+        model = load_model('moby.txt')['log']
+    session = ReadableSession(message, model, key)
     print('This is the first attempt at decoding the message:\n')
-    print(updated_message)
-    changed = {} # This dictionary holds which characters have been switched so that later the user can see their changes
-    if verbose: # If verbose is true, this part of code runs and shows the intermediate steps
-        while True:
-            while True:
-                char1 = input('Please input the character you would like to be replaced: ' )
-                char2 = input('Please input the character you would like to be replaced with: ' )
-                char1 = char1.upper() # upper() turns the input into upper case characters, it does not affect the space character
-                char2 = char2.upper()
-                if char1 in alphabet and char2 in alphabet and len(char1)==1 and len(char2)==1:
-                    break # this checks that the inputs are only one character each and in our list of allowed characters
-                else:
-                    print('The input is not valid') # otherwise the while loop asks them to re-enter a valid input
-    
-            changed.update({char1:char2}) # This appends the swapped characters to the dictionary
-            # This uses our swap function to alter the decoded message
-            updated_message = swap(updated_message, char1, char2) 
-            print(updated_message) # Outputs new message with the swaps made
-    
-            while True: # This deals with whether the user wants to continue hand adjusting the cipher or is happy with the output
-                answer =  input('Would you like to continue? Yes/No: ' )
-                if answer not in ['Y','y','Yes','yes','N','n','No','no']:
-                    print('That is not a valid option')
-                    continue
-                else: 
-                    break
-            
-            if answer in ['Y','y','Yes','yes']:
-                continue
-            else: 
-                print('The message is as follows:\n' + updated_message)
-                print('The changed characters is as follows' ,changed)
-                return(updated_message)
-    else: # This part of code runs if verbose is set to False, it does not show the intermediate steps
+    print(session.text)
+    while True:
         while True:
-            while True:
-                char1 = input('Please input the character you would like to be replaced: ' )
-                char2 = input('Please input the character you would like to be replaced with: ' )
-                char1 = char1.upper() 
-                char2 = char2.upper()
-                if char1 in alphabet and char2 in alphabet and len(char1)==1 and len(char2)==1:
-                    break 
-                else:
-                    print('The input is not valid') 
-            changed.update({char1:char2}) 
-            updated_message = swap(updated_message, char1, char2) 
-            while True:
-                answer =  input('Would you like to continue? Yes/No: ' )
-                if answer not in ['Y','y','Yes','yes','N','n','No','no']:
-                    print('That is not a valid option')
-                    continue
-                else: 
-                    break
-            
-            if answer in ['Y','y','Yes','yes']:
+            char1 = input('Please input the character you would like to be replaced: ' )
+            char2 = input('Please input the character you would like to be replaced with: ' )
+            char1 = char1.upper() # upper() turns the input into upper case characters, it does not affect the space character
+            char2 = char2.upper()
+            if char1 in alphabet and char2 in alphabet and len(char1)==1 and len(char2)==1:
+                break # this checks that the inputs are only one character each and in our list of allowed characters
+            else:
+                print('The input is not valid') # otherwise the while loop asks them to re-enter a valid input
+
+        # This swaps the two characters in the key and updates the score
+        session.swap_plain(char1, char2)
+        if verbose: # If verbose is true, the intermediate steps are shown
+            print(session.text) # Outputs new message with the swaps made
+            suggestions = session.suggestions(3)
+            if suggestions:
+                print('Swaps that would make it more plausible:', suggestions)
+            else:
+                print('No single swap would make it more plausible')
+
+        while True: # This deals with whether the user wants to continue hand adjusting the cipher or is happy with the output
+            answer =  input('Would you like to continue? Yes/No: ' )
+            if answer not in ['Y','y','Yes','yes','N','n','No','no']:
+                print('That is not a valid option')
                 continue
             else: 
-                print('The message is as follows:\n' + updated_message)
-                print('The changed characters is as follows' ,changed)
-                return(updated_message)   
-        
+                break
+
+        if answer not in ['Y','y','Yes','yes']:
+            updated_message = session.text
+            print('The message is as follows:\n' + updated_message)
+            print('The changed characters is as follows' ,dict(session.swaps))
+            return(updated_message)
 
 
 # In[52]:
@@ -270,6 +276,25 @@ def readable(message,verbose = False):
 readable(message2,True)
 
 
+# In[ ]:
+
+
+# Test cell: undoing every swap of a ReadableSession must give back the starting key and score exactly, and redoing
+# them the key and score after the last swap, and suggested swaps must all raise the score
+session = ReadableSession(message2, load_model('moby.txt')['log'], CipherKey.from_dict(switch(message2)))
+start_key, start_score = session.key.forward.copy(), session.score
+for ch1, ch2 in [('F', 'G'), ('I', 'H'), ('V', 'K'), ('N', 'I'), ('W', 'U')]:
+    session.swap_plain(ch1, ch2)
+end_key, end_score = session.key.forward.copy(), session.score
+while session.undo():
+    pass
+assert (session.key.forward == start_key).all() and session.score == start_score
+while session.redo():
+    pass
+assert (session.key.forward == end_key).all() and session.score == end_score
+assert all(delta > 0 for ch1, ch2, delta in session.suggestions(351))
+
+
 # Decoded message 2 reads as follows:
 # 
 # Sherlock Holmes preserved his calm professional manner until our visitor had left us, although it was easy for me, who knew him so well, to see that he was profoundly excited. The moment that Hilton Cubitt’s broad back had disappeared through the door my comrade rushed to the table, laid out all the slips of paper containing dancing men in front of him, and threw himself into an intricate and elaborate calculation. For two hours I watched him as he covered sheet after sheet of paper with figures and letters, so completely absorbed in his task that he had evidently forgotten my presence. Sometimes he was making progress and whistled and sang at his work; sometimes he was puzzled, and would sit for long spells with a furrowed brow and a vacant eye. Finally he sprang from his chair with a cry of satisfaction, and walked up and down the room rubbing his hands together. Then he wrote a long telegram upon a cable form. “If my answer to this is as I hope, you will have a very pretty case to add to your collection, Watson,” said he, “I expect that we shall be able to go down to Norfolk tomorrow, and to take our friend some very definite news as to the secret of his annoyance.”
@@ -330,46 +355,32 @@ bigram_freq(moby_alt[:20])
 
 import numpy as np # This module is imported so we can use the built-in log function
 
-log_dict = bigram_freq(moby_alt) # This stores the result from our p(i,j) functions for all bigrams that appear in moby dick
+# Rather than recounting Moby Dick every time, load_model() from codebreaking/language_model.py works out the character
+# counts, the bigram counts and the log(p(i,j)) values once, using the same formula as above, and saves them
+# in the model_cache folder. The next time it is called, the saved model is used unless moby.txt has changed.
+from codebreaking.language_model import encode, decode, load_model, score_codes
 
-#This deals with bigrams not in moby dick
-all_bigrams = []
-for i in alphabet:
-    for j in alphabet: # Here we concatenate the 2 characters to form a bigram, this creates 729 unique bigrams
-        bigram = i+j
-        all_bigrams.append(bigram)
+moby_model = load_model('moby.txt')
 
+# Looking up two character strings in a dictionary is slow when it has to be done for every bigram of every
+# candidate message, so the log(p(i,j)) values are kept in a 27x27 matrix, where row i and column j hold
+# log p(i,j) for the i-th and j-th characters of our alphabet
+log_matrix = moby_model['log']
 
-# Checks if a bigram appears in Moby Dick, if not, assigns it a a freq of 0 and finds resulting p(i,j) value and adds it to 
-# the log_dict
-Sample = dict(Counter(moby_alt))
-for x in all_bigrams:
-    if x in log_dict: # It is in Moby Dick, so nothing further needs to be done
-        continue
-    else: # It is not found in Moby Dick, need to add a p(i,j) value
-        bigram_split = list(x) 
-        f = Sample.get(bigram_split[0]) 
-        p = 1/f 
-        log_dict.update({x:p})
-
-for key in log_dict: 
-    log_dict.update({key:np.log(log_dict[key])}) # We then take the log of all the p(i,j) values and update the dictionary
+# log_dict holds the same values, keyed by the bigram itself
+log_dict = {first + second: log_matrix[i, j] for i, first in enumerate(alphabet) for j, second in enumerate(alphabet)}
 
 
 # Now that we have a probability of all bigrams, we can code in a function called plausibility_score that will compute a score for any text m. This is going to be later used in the Metropolis algorithm. First it calculates the logarithm of the probability of each bigram that occurs in a text in chronological order, and sums it from the first character to the character before the last. This then gives the plausibility score.
+# The message is encoded into alphabet indexes once (encode() is in codebreaking/language_model.py) and then all of its bigrams are scored together using log_matrix, which gives the same values as summing log_dict.get() over every bigram.
 
 # In[22]:
 
 
-def plausibility_score(message):
-    # split message into bigrams
-    #takes each bigram in the message and finds it in logdict
-    #then adds it to the score counter
-    score = 0 # This variable will hold the sum of each log(p(i,j))
-    message_bigrams = [message[i : i + 2] for i in range(len(message) - 1)] # Stores all the bigrams as strings in a list
-    for i in message_bigrams: # adds the score for each bigram in the message to the total score
-        score += log_dict.get(i)
-    return score
+def plausibility_score(message,model=log_matrix):
+    # The encoded message gives the row (first character) and column (second character) of every bigram,
+    # score_codes then adds up the log(p(i,j)) values of all of them
+    return score_codes(encode(message), model)
 
 
 # In[23]:
@@ -380,6 +391,46 @@ text = 'ABRACADABRA'
 plausibility_score(text)
 
 
+# With a plausibility score we no longer need to find the shift of message 1 by trial and error as in Section 1: we can score all 27 shifts and pick the most plausible one. shift_scores in codebreaking/solvers.py does this for many messages at once, by counting the bigrams of every message and multiplying them with the log matrix shifted all 27 ways in one matrix product, so large numbers of messages can be checked for simple shifts before trying the slower Metropolis method on them.
+
+# In[ ]:
+
+
+from codebreaking.solvers import rank_shifts
+
+# Returns the shifts of message from most to least plausible, each with its score and the shifted message
+def solve_shift(message, model=log_matrix):
+    codes = encode(message)
+    shifts, scores = rank_shifts([codes], model)
+    return [(shift, score, decode((codes + shift) % len(alphabet))) for shift, score in zip(shifts[0], scores[0])]
+
+
+# In[ ]:
+
+
+# This finds the shift of 9 for message 1 and prints the decoded message
+shift, score, decoded = solve_shift(message1)[0]
+print(shift, decoded)
+
+
+# A cyclic shift uses the same shift for every character. A periodic (Vigenère) cipher cycles through a short list of shifts instead, so the 1st, 5th, 9th, ... characters might be shifted by 2, the 2nd, 6th, 10th, ... by 14, and so on. Characters a multiple of the period apart are shifted by the same amount, so they are equal as often as in normal text, while other pairs are only equal about as often as in random text. codebreaking/vigenere.py counts how often the message matches itself at every offset at once with a fast Fourier transform, picks the period from that, and then solves each column (every period-th character) like message 1, first from its character frequencies and then from the bigrams it makes with the columns next to it.
+
+# In[ ]:
+
+
+from codebreaking.vigenere import solve_vigenere
+
+def solve_periodic(message, model=moby_model, period=None):
+    codes, period, shifts = solve_vigenere(encode(message), model, period)
+    return decode(codes), period, shifts
+
+# Test cell: a passage of Moby Dick encrypted with the shifts of the word CODE
+shifts = np.array([alphabet.index(ch) for ch in 'CODE'])
+passage = moby_codes[5000:5400]
+vigenere_message = decode((passage - shifts[np.arange(len(passage)) % len(shifts)]) % len(alphabet))
+solve_periodic(vigenere_message)
+
+
 # ##  Section 6: Using the Plausibility score and Metropolis algorithm
 
 # 
@@ -401,35 +452,21 @@ plausibility_score(text)
 # In[25]:
 
 
-import random
-import math
+# Swapping two characters in the whole message and rescoring it from scratch gets slow for long messages, so
+# the Metropolis steps are carried out by anneal() in codebreaking/solvers.py. It counts the bigrams of the coded message
+# once and keeps track of the cipher as a key (key[c] is the index of the character that coded character c
+# decodes to), so a swap only needs to rescore the bigrams that contain one of the two swapped characters.
+# The decrypted message is only built at the very end.
+from codebreaking.solvers import anneal, cipher_counts, steepest_ascent
 
-def metropolis(message,T):
+def metropolis(message,T,model=log_matrix):
     # Here we start off with our first_try function from above as our first decrypted message.
     start = first_try(message)
     print(start)
-    for n in range(10000):
-        Sm0 = plausibility_score(start)
-        #randomly pick 2 letters in alphabet list (no rep)
-        ch1 = random.choice(alphabet)
-        while True: # Keeps choosing a random character until one is selected which is distinct from character 1
-            ch2 = random.choice(alphabet)
-            if ch2 != ch1:
-                break
-        new_message = swap(start,ch1,ch2) # This swaps the 2 characters in the message
-        Sm1 = plausibility_score(new_message) # Assigns a plausibility score to the new message
-        # replaces new message with old if new is more plausible
-        if Sm1 > Sm0:
-            start = new_message
-        else:
-            prob = math.exp((Sm1-Sm0)/T) # This is the probability that we replace the 
-            # old message with the new even though it has a lower plausibility score
-            random_float = random.random() # This generates a random float in [0,1] with uniform distribution
-            if random_float <= prob: # Replaces old message
-                start = new_message
-            else: # Does not change the message
-                continue
-    return start
+    codes = encode(message)
+    # The first_try cipher is the starting key and a = 1 keeps T fixed for all 10000 iterations
+    key, score = anneal(cipher_counts(codes, model), model, CipherKey.from_dict(switch(message)), T=T, a=1)
+    return CipherKey(key).apply(message)
 
 
 # Using the Metropolis function and varying T values we decrypted messages 3,4,5,6,7 and 8. We had to run the function numerous times and hand adjust the cipher slightly.
@@ -441,40 +478,47 @@ def metropolis(message,T):
 metropolis(message9,1)
 
 
+# In[ ]:
+
+
+from codebreaking.language_model import load_ngram_model
+from codebreaking.solvers import key_score, swap_delta
+
+# Test cell: the change in score anneal() works out from a swap must be the same as scoring the whole message
+# again, for the bigram matrix and (see Section 6) the trigram table
+rng = np.random.default_rng(0)
+for message in (message2, message7, message9):
+    codes = encode(message)
+    for model in (log_matrix, load_ngram_model('moby.txt', 3)):
+        counts = cipher_counts(codes, model)
+        for _ in range(100):
+            key = rng.permutation(len(alphabet))
+            i, j = rng.choice(len(alphabet), 2, replace=False)
+            swapped = key.copy()
+            swapped[i], swapped[j] = key[j], key[i]
+            full = key_score(counts, model, swapped) - key_score(counts, model, key)
+            assert abs(swap_delta(counts, model, key, i, j) - full) < 1e-6 * max(abs(full), 1)
+
+
 # The above output is unreadable so we must adjust our code somehow. Below we adapted the metropolis function to use simulated annealing. This is where T takes an initial value of 10 but gradually decreases by a constant ratio so that finally we reach T=0.1. This means as the algorithm progresses, it is less likely to accept a version of the message which makes it less readable. This makes it so that there is less human intervention and the program can run through T values.
 
 # In[27]:
 
 
-def metropolis_ext(message):
+# To see whether a run has settled down or was wasted, an observer can be passed in: a Telemetry object (from codebreaking/telemetry.py) records the current and best score, T, the fraction of swaps accepted and the steps per second every 100 steps, and can save them with to_csv() or to_json().
+# Other temperature schedules and stopping rules from codebreaking/schedules.py can be passed in as schedule and stop, with n_iter as the most steps to take.
+# With polish=True the key is finished off by steepest_ascent (see below) once the annealing is over.
+def metropolis_ext(message,model=log_matrix,observer=None,n_iter=10000,schedule=None,stop=None,polish=False):
     start = first_try(message)
     print(start)
-    T = 10
-    a = 0.01**(1/100)
-    for n in range(10000):
-        if n%100 == 0: # Every 100 steps, T decreases by a constant ratio a
-            T = T*a
-        Sm0 = plausibility_score(start)
-        #randomly pick 2 letters in alphabet list (no rep)
-        ch1 = random.choice(alphabet)
-        while True: # Keeps choosing a random character until one is selected which is distinct from character 1
-            ch2 = random.choice(alphabet)
-            if ch2 != ch1:
-                break
-        new_message = swap(start,ch1,ch2) # This swaps the 2 characters in the message
-        Sm1 = plausibility_score(new_message) # Assigns a plausibility score to the new message
-        # replaces new message with old if new is more plausible
-        if Sm1 > Sm0:
-            start = new_message
-        else:
-            prob = math.exp((Sm1-Sm0)/T) # This is the probability that we replace the 
-            # old message with the new even though it has a lower plausibility score
-            random_float = random.random() # This generates a random float in [0,1] with uniform distribution
-            if random_float <= prob: # Replaces old message
-                start = new_message
-            else: # Does not change the message
-                continue
-    return start
+    codes = encode(message)
+    counts = cipher_counts(codes, model)
+    # T starts at 10 and every 100 steps it decreases by a constant ratio a = 0.01**(1/100)
+    key, score = anneal(counts, model, CipherKey.from_dict(switch(message)), T=10, a=0.01**(1/100),
+                        n_iter=n_iter, observer=observer, schedule=schedule, stop=stop)
+    if polish:
+        key, score, swaps = steepest_ascent(counts, model, key)
+    return CipherKey(key).apply(message)
 
 
 # In[57]:
@@ -484,6 +528,19 @@ def metropolis_ext(message):
 metropolis_ext(message9)
 
 
+# Most messages are solved well before the 10,000th step, after which the rest of the run is wasted. With an EarlyStop the run ends once the best score has not improved for 2000 steps, which on messages of a few hundred characters or more takes about half as long for the same result. Short messages are harder, and for those it is worth allowing more steps and using an AcceptanceSchedule, which raises T again when too few swaps are accepted and lowers it when too many are, instead of cooling at a fixed rate.
+
+# In[ ]:
+
+
+from codebreaking.schedules import AcceptanceSchedule, EarlyStop
+
+stop = EarlyStop(patience=2000)
+print(metropolis_ext(message9, stop=stop))
+print('Stopped after', stop.stopped_at, 'steps')
+print(metropolis_ext(message9, n_iter=30000, schedule=AcceptanceSchedule(n_iter=30000), stop=EarlyStop(patience=5000)))
+
+
 # Still this code looks unreadable in English, however some of the word lengths and sentence structures resemble those in the French language. Therefore, we shall write a new piece of code which uses a large piece of French text instead for it's sample text. We decided to use The Count of Monte Cristo, and shall write a text file in the same way we created one for Moby Dick.
 
 # In[29]:
@@ -494,13 +551,10 @@ monte = requests.get(link).text
 with open('monte.txt','w',errors='ignore') as f:
     f.write(monte.upper()) # write to file
 
-# This code opens our pre-made text file and reads it into a string variable called monte
-with open('monte.txt','r',errors='ignore',encoding = 'utf-8') as f:
-    monte=f.read() 
-    
-# Here we deal with non alphabetical characters and those that aren't white spaces.
-monte_exception = re.sub(r'[^A-Z\-\'"]+', ' ', monte) 
-monte_alt = re.sub(r'[\-\'"]+','',monte_exception)
+# This code opens our pre-made text file and cleans it in the same way as Moby Dick
+with open('monte.txt','rb') as f:
+    monte_codes = normalize_codes(f.read())
+monte_alt = decode(monte_codes)
 
 
 # As a lot of our previous code incorporated the analysis of Moby Dick, we must adjust these functions so that they instead use The Count of Monte Cristo.
@@ -508,63 +562,22 @@ monte_alt = re.sub(r'[\-\'"]+','',monte_exception)
 # In[58]:
 
 
-# Inputting a different sample text into the bigram_freq function
-log_dict_french = bigram_freq(monte_alt) 
-
-all_bigrams = []
-for i in alphabet:
-    for j in alphabet: 
-        bigram = i+j
-        all_bigrams.append(bigram)
+# Loading the model of a different sample text
+monte_model = load_model('monte.txt')
+log_matrix_french = monte_model['log']
+log_dict_french = {first + second: log_matrix_french[i, j] for i, first in enumerate(alphabet) for j, second in enumerate(alphabet)}
 
-Sample = dict(Counter(monte_alt))
-for x in all_bigrams:
-    if x in log_dict_french: 
-        continue
-    else: 
-        bigram_split = list(x) 
-        f = Sample.get(bigram_split[0]) 
-        p = 1/f 
-        log_dict_french.update({x:p})
-
-for key in log_dict_french: 
-    log_dict_french.update({key:np.log(log_dict_french[key])}) 
-
-# Altering the plausibility score function to use the french log dictionary
+# Altering the plausibility score function to use the french log matrix
 def plausibility_score_french(message):
-    message_bigrams = [message[i : i + 2] for i in range(len(message) - 1)] 
-    score = 0
-    for i in message_bigrams: 
-        score += log_dict_french.get(i)
-    return score
-
-# Making sure the metropolis extended function uses the french plausibility function
-def metropolis_ext_french(message):
+    return score_codes(encode(message), log_matrix_french)
+
+# Making sure the metropolis extended function uses the french log matrix
+def metropolis_ext_french(message,model=log_matrix_french):
     start = message # This has also been adjusted to use just the initial message rather than the first try output
     print(start)
-    T = 10
-    a = 0.01**(1/100)
-    for n in range(10000):
-        if n%100 == 0: 
-            T = T*a
-        Sm0 = plausibility_score_french(start)
-        ch1 = random.choice(alphabet)
-        while True: 
-            ch2 = random.choice(alphabet)
-            if ch2 != ch1:
-                break
-        new_message = swap(start,ch1,ch2) 
-        Sm1 = plausibility_score_french(new_message) 
-        if Sm1 > Sm0:
-            start = new_message
-        else:
-            prob = math.exp((Sm1-Sm0)/T)  
-            random_float = random.random() 
-            if random_float <= prob: 
-                start = new_message
-            else: 
-                continue
-    return start
+    codes = encode(message)
+    key, score = anneal(cipher_counts(codes, model), model, CipherKey(), T=10, a=0.01**(1/100))
+    return CipherKey(key).apply(message)
 
 
 # In[31]:
@@ -576,6 +589,231 @@ metropolis_ext_french(message9)
 
 # As we can see above, once we substituted a French text into the functions we defined before, we were able to use the Metropolis function to decypher the code. 
 
+# In our conclusion we mention that trigrams would have helped with the shorter messages. load_ngram_model in codebreaking/language_model.py builds the log probabilities of trigrams and quadgrams from the same sample texts, generalising our formula to $p(w):=\frac{frequency(w)+1}{frequency(w')}$, where $w'$ is the n-gram $w$ without its last character (for bigrams this is exactly $p(i,j)$). The probabilities are stored in one flat array with an entry for every possible n-gram, $27^{4}$ = 531441 entries for quadgrams. The plausibility score and Metropolis functions accept these tables in place of log_matrix through their model argument.
+
+# In[ ]:
+
+
+from codebreaking.language_model import load_ngram_model
+
+trigram_model = load_ngram_model('moby.txt', 3)
+quadgram_model = load_ngram_model('moby.txt', 4)
+quadgram_model_french = load_ngram_model('monte.txt', 4)
+
+# Test cell using trigrams on message 7, one of our shortest messages. With the usual schedule of 10000 steps the
+# trigram tables work best; the quadgram scores change so much with every swap that at low T the chain tends to
+# get stuck, so they need a higher starting T or several chains (see metropolis_parallel).
+metropolis_ext(message7, model=trigram_model)
+
+
+# A single run of the annealing can still get stuck with a message that is almost, but not quite, readable, and we found ourselves running it again and again and comparing the outputs by eye. metropolis_parallel runs a number of independent chains at once, one per processor core by default, each starting from the first_try cipher with its own random seed. It returns the decryption with the highest plausibility score together with the final score of every chain, so we can see how many of the chains agreed.
+
+# In[ ]:
+
+
+from codebreaking.solvers import parallel_anneal
+
+def metropolis_parallel(message, n_chains=None, seed=0, model=log_matrix):
+    codes = encode(message)
+    key, score, scores = parallel_anneal(cipher_counts(codes, model), model, CipherKey.from_dict(switch(message)),
+                                         n_chains=n_chains, seed=seed)
+    return CipherKey(key).apply(message), score, scores
+
+
+# In[ ]:
+
+
+# Test cell for the parallel version, using the french log matrix for message 9
+metropolis_parallel(message9, n_chains=4, model=log_matrix_french)
+
+
+# Independent chains do not help each other: a chain that is stuck stays stuck. With replica exchange (parallel tempering) a few copies of the key are annealed at once, each at its own fixed temperature, and every 100 steps neighbouring copies may swap keys, with the better key more likely to move to the colder copy. A cold copy stuck in a local optimum can then be swapped out to a hotter one, which can wander away from it. The last value returned is how often each pair of neighbouring temperatures swapped; if one of these is close to 0 the temperatures are too far apart.
+
+# In[ ]:
+
+
+from codebreaking.solvers import parallel_tempering
+
+def metropolis_tempering(message, temperatures=(0.2, 0.6, 1.7, 5), n_iter=5000, seed=0, model=log_matrix):
+    codes = encode(message)
+    key, score, exchanges = parallel_tempering(cipher_counts(codes, model), model, CipherKey.from_dict(switch(message)),
+                                               temperatures=temperatures, n_iter=n_iter, seed=seed)
+    return CipherKey(key).apply(message), score, exchanges
+
+
+# In[ ]:
+
+
+# Test cell for replica exchange on message 9 with the french log matrix
+metropolis_tempering(message9, model=log_matrix_french)
+
+
+# Most of the time of a Metropolis step goes on running the Python loop rather than on the arithmetic, which only touches two rows and two columns of a 27 by 27 matrix. batched_anneal keeps the keys of many chains as the rows of a single array and moves all of them one step at a time: the swaps of all the chains are drawn together, their score changes are worked out with a handful of array operations, and the accepted swaps are made with a mask. On one core, 32 chains take about one and a half times as long as 2 chains of metropolis_ext run one after the other.
+
+# In[ ]:
+
+
+from codebreaking.solvers import batched_anneal, rank_candidates
+
+# If a lexicon (see below) is passed in, chains whose scores are nearly the same are told apart by how many real words they decode to.
+def metropolis_batched(message, n_chains=32, seed=0, model=log_matrix, lexicon=None):
+    codes = encode(message)
+    keys, scores = batched_anneal(cipher_counts(codes, model), model, CipherKey.from_dict(switch(message)),
+                                  n_chains=n_chains, seed=seed)
+    best = int(np.argmax(scores)) if lexicon is None else rank_candidates(codes, keys, scores, lexicon)[0]
+    return CipherKey(keys[best]).apply(message), scores[best], scores
+
+
+# In[ ]:
+
+
+# Test cell for the batched chains on message 9 with the french log matrix
+metropolis_batched(message9, model=log_matrix_french)
+
+
+# In[ ]:
+
+
+from codebreaking.solvers import batched_swap_deltas
+
+# Test cell: the score changes of the batched chains must be the same as those of swap_delta() one chain at a time
+rng = np.random.default_rng(0)
+for message in (message2, message7, message9):
+    counts = cipher_counts(encode(message), log_matrix)
+    keys = np.array([rng.permutation(len(alphabet)) for _ in range(32)])
+    i = rng.integers(len(alphabet), size=32)
+    j = (i + rng.integers(1, len(alphabet), size=32)) % len(alphabet)
+    deltas = batched_swap_deltas(counts, log_matrix, keys, i, j)
+    for k in range(32):
+        assert abs(deltas[k] - swap_delta(counts, log_matrix, keys[k], i[k], j[k])) < 1e-6 * max(abs(deltas[k]), 1)
+
+
+# Near the end of a run, when only one or two letters are still wrong, the annealing spends thousands of steps trying random swaps that almost never help. steepest_ascent instead works out the change in score of all 351 possible swaps of two letters at once, makes the best one, and repeats until no swap improves the score. On its own it only climbs to the nearest local optimum, so it is not a replacement for the annealing, but after a short run it fixes the last few letters in a few milliseconds.
+
+# In[ ]:
+
+
+def steepest(message, model=log_matrix):
+    codes = encode(message)
+    key, score, swaps = steepest_ascent(cipher_counts(codes, model), model, CipherKey.from_dict(switch(message)))
+    print(swaps, 'swaps')
+    return CipherKey(key).apply(message)
+
+
+# In[ ]:
+
+
+# Test cell: steepest ascent from first_try, and a short annealing run polished by steepest ascent
+print(steepest(message9, model=log_matrix_french))
+print(metropolis_ext(message9, model=log_matrix_french, n_iter=2000, polish=True))
+
+
+# The plausibility score only looks at pairs of letters, so it cannot tell a real word from a made up one that is easy to pronounce, and a decryption with a high score can still need a few swaps by hand. load_lexicon collects every word that appears at least twice in a sample text (cached on disk next to the models), and word_hit_rate gives the fraction of the words of a decryption that are in it. This is cheap enough to be checked while the annealing runs: a WordStop ends the run as soon as 90% of the words are real, which for messages of a few hundred characters or more usually happens well before the 10,000th step. It is combined here with an EarlyStop so the run also ends if it never gets that far.
+
+# In[ ]:
+
+
+from codebreaking.language_model import load_lexicon, word_hit_rate
+from codebreaking.schedules import WordStop, AnyStop
+
+moby_lexicon = load_lexicon('moby.txt')
+monte_lexicon = load_lexicon('monte.txt')
+
+
+# In[ ]:
+
+
+# Test cell: message 2 with the word test, and the batched chains on message 9 using the lexicon to break ties
+stop = AnyStop(WordStop(encode(message2), moby_lexicon), EarlyStop(patience=3000))
+decrypted = metropolis_ext(message2, stop=stop)
+print(decrypted)
+print('Stopped after', stop.stopped_at, 'steps with', word_hit_rate(decrypted, moby_lexicon), 'of the words found')
+metropolis_batched(message9, model=log_matrix_french, lexicon=monte_lexicon)
+
+
+# All the functions above run for a fixed number of steps and only give an answer at the end. When there is a time limit instead, anneal_anytime in codebreaking/solvers.py runs until a number of seconds has passed (or a deadline, or until it is cancelled from another thread with a threading.Event), with T falling from 10 to 0.1 over the time available rather than over 10,000 steps. It is a generator that hands back the best key so far every time it improves, so the latest answer can be shown while it is still running, and the last one it gives is the best.
+
+# In[ ]:
+
+
+from codebreaking.solvers import anneal_anytime
+
+def metropolis_anytime(message, seconds=1.0, model=log_matrix):
+    codes = encode(message)
+    for key, score, steps in anneal_anytime(cipher_counts(codes, model), model, CipherKey.from_dict(switch(message)),
+                                            seconds=seconds):
+        print(steps, score, CipherKey(key).apply(message)[:60]) # The start of the best decryption so far
+    return CipherKey(key).apply(message)
+
+
+# In[ ]:
+
+
+# Test cell: message 2 with half a second to spare
+metropolis_anytime(message2, seconds=0.5)
+
+
+# In[ ]:
+
+
+# Test cell: every key handed back is a new one, scored exactly and more plausible than the one before
+from codebreaking.solvers import key_score
+
+counts = cipher_counts(encode(message2), log_matrix)
+steps = anneal_anytime(counts, log_matrix, CipherKey.from_dict(switch(message2)), seconds=0.5)
+found = list(steps)
+assert all(score == key_score(counts, log_matrix, key) for key, score, n in found)
+assert all(later[1] > earlier[1] and not np.array_equal(later[0], earlier[0])
+           for earlier, later in zip(found, found[1:]))
+print(len(found), 'improvements')
+
+
+# We only spotted that message 9 was in French by looking at the word lengths, and then had to call a separate French function. A substitution cipher scrambles which character is which, but not how the frequencies are spread out: sorted from the most to the least common, the character and bigram frequencies of a coded message look like those of its language. rank_languages in codebreaking/language_model.py compares this profile of a message with the profiles of all our sample texts at once, and metropolis_any_language then runs the annealing for the closest language, and for the second closest too when the two are nearly as close (which is where the ranking is often wrong for short messages), and keeps the most plausible result.
+
+# In[ ]:
+
+
+from codebreaking.language_model import load_models
+from codebreaking.solvers import solve_any_language
+
+models = load_models() # The english (Moby Dick) and french (The Count of Monte Cristo) models
+
+def metropolis_any_language(message, top=2):
+    codes = encode(message)
+    key, language, score, ranking = solve_any_language(codes, models, top=top)
+    print(ranking) # The languages from closest to furthest
+    return CipherKey(key).apply(message), language
+
+
+# In[ ]:
+
+
+# Test cell, message 9 should come out in french
+metropolis_any_language(message9)
+
+
+# Rather than editing the test cells above for every message, a whole set of messages can be decrypted from the command line with codebreaking/batch_decrypt.py, which loads the language model once and shares the messages out between the processor cores. For example `python -m codebreaking.batch_decrypt < messages.txt` decrypts one message per line, `python -m codebreaking.batch_decrypt --corpus monte.txt message9.txt` decrypts a French message from a file, and each result is printed as a line of JSON with the decrypted text, its score, the time taken and the number of iterations used.
+
+# Running this notebook downloads both books, builds every model and waits for input in readable(), so other programs should not import it. The functions it uses all live in the codebreaking package instead, which does nothing when it is imported: `import codebreaking` takes a few milliseconds and does not even load NumPy until a function that needs it is first used. `codebreaking.decrypt(message)` then finds the language of the message, loads its model from the cache in model_cache (built from moby.txt or monte.txt the first time) and keeps it for later calls. The sample texts and model_cache are looked for next to this notebook whatever folder the program is run from, or in the folders named by the CODEBREAKING_DATA and CODEBREAKING_CACHE environment variables, so the package works offline; if a sample text is missing it says so rather than downloading it, and `codebreaking.fetch_corpus('english')` downloads it as in Section 2.
+# To decrypt messages from other programs without loading the models for every one, `python -m codebreaking.server` keeps the models loaded in a pool of worker processes and answers requests over HTTP on localhost (or on a Unix socket with --unix): `curl -d '{"message": "..."}' http://127.0.0.1:8765/decrypt` returns the decrypted text as JSON. When more requests arrive than there are workers, the waiting ones are shared out between the workers in small batches, each answered as soon as it is decrypted, and http://127.0.0.1:8765/metrics shows how many are waiting and how long they have been taking.
+
+# A sample text much bigger than Moby Dick would not fit in memory all at once, so count_stream in codebreaking/language_model.py reads a file a chunk at a time, and build_model_from_files splits one or more files into shards that are counted in parallel and added together. The cell below checks that the counts come out exactly the same as those of load_model() whatever the chunk or shard size, and stops with an AssertionError if they ever disagree.
+
+# In[ ]:
+
+
+from codebreaking.language_model import count_stream, build_model_from_files
+
+# Test cell: chunked and sharded counts against the cached model
+for chunk_size in (1000, 4097, 1 << 20):
+    unigram, bigram = count_stream('moby.txt', chunk_size=chunk_size)
+    assert (unigram == moby_model['unigram']).all() and (bigram == moby_model['bigram']).all(), chunk_size
+for n_shards in (1, 3, 8):
+    sharded = build_model_from_files(['moby.txt'], n_shards=n_shards, chunk_size=4097)
+    assert (sharded['bigram'] == moby_model['bigram']).all(), n_shards
+    assert np.allclose(sharded['log'], log_matrix), n_shards
+
+
 # ## Section 7: Decoded Messages
 # Below are all the messages we were able to decode, with our best guess at capitalisation and punctuation:
 # 
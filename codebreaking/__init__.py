@@ -0,0 +1,56 @@
+# Code breaking with statistical physics: the functions of "Mehmed 15.05.21.py" as an importable package.
+# Importing the package does no work. The names below are looked up in their submodules the first time they
+# are used, so NumPy is only imported once something that needs it is, and the language models are only
+# loaded by models.get_model() the first time a language is needed.
+#
+#   import codebreaking
+#   text, language, score = codebreaking.decrypt(message)
+
+import importlib
+
+# The public names of the package and the submodule each one lives in
+_exports = {
+    'decrypt': 'api',
+    'CipherKey': 'cipher_key',
+    'alphabet': 'language_model',
+    'decode': 'language_model',
+    'encode': 'language_model',
+    'normalize': 'language_model',
+    'word_hit_rate': 'language_model',
+    'fetch_corpus': 'models',
+    'get_lexicon': 'models',
+    'get_model': 'models',
+    'get_models': 'models',
+    'AcceptanceSchedule': 'schedules',
+    'AnyStop': 'schedules',
+    'EarlyStop': 'schedules',
+    'GeometricSchedule': 'schedules',
+    'WordStop': 'schedules',
+    'ReadableSession': 'session',
+    'anneal': 'solvers',
+    'anneal_anytime': 'solvers',
+    'batched_anneal': 'solvers',
+    'cipher_counts': 'solvers',
+    'close_languages': 'solvers',
+    'frequency_key': 'solvers',
+    'parallel_anneal': 'solvers',
+    'parallel_tempering': 'solvers',
+    'solve_any_language': 'solvers',
+    'steepest_ascent': 'solvers',
+    'Telemetry': 'telemetry',
+    'solve_vigenere': 'vigenere',
+}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
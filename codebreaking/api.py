@@ -0,0 +1,33 @@
+# Decryption of a substitution cipher in one call, for use from other programs.
+# The models come from models.py, so the first call loads them and later calls reuse them.
+
+import random
+
+from .language_model import decode, encode, rank_languages
+from .models import get_model, get_models
+from .solvers import anneal, anneal_within, cipher_counts, close_languages, frequency_key
+
+
+# Decrypts message, a string of alphabet characters. If language is not given the languages are ranked with
+# rank_languages() and, as in solvers.solve_any_language(), the closest one is annealed together with the
+# runner up when the two are close, keeping the more plausible result. With seconds the annealing follows the
+# time budget with anneal_within() (shared between the languages tried), otherwise it takes n_iter steps with
+# the schedule of metropolis_ext stretched over them. Returns the decrypted text, the language and the
+# plausibility score.
+def decrypt(message, language=None, seconds=None, n_iter=10000, seed=0):
+    codes = encode(message)
+    languages = [language] if language else close_languages(rank_languages(codes, get_models()))
+    best = None
+    for name in languages:
+        model = get_model(name)
+        counts = cipher_counts(codes, model['log'])
+        start = frequency_key(codes, model['unigram'])
+        if seconds is not None:
+            key, score, steps = anneal_within(counts, model['log'], start, seconds / len(languages),
+                                              rng=random.Random(seed))
+        else:
+            key, score = anneal(counts, model['log'], start, n_iter=n_iter, step=max(n_iter // 100, 1),
+                                rng=random.Random(seed))
+        if best is None or score > best[2]:
+            best = decode(key[codes]), name, score
+    return best
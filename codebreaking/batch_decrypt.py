@@ -0,0 +1,129 @@
+# Decrypts many substitution ciphers in one go.
+# The language model is loaded once for the whole batch and handed to a pool of worker processes, each message
+# is encoded once and annealed from its first_try() key, and one line of JSON is written per message with the
+# decrypted text, its plausibility score, the time taken and the number of iterations used, or with an error
+# for a message that is not made of alphabet characters.
+#
+# Usage:
+#   python -m codebreaking.batch_decrypt message_files...         (one message per file)
+#   python -m codebreaking.batch_decrypt < messages.txt           (one message per line)
+#   python -m codebreaking.batch_decrypt --corpus monte.txt ...   (decrypt French messages)
+#   python -m codebreaking.batch_decrypt --telemetry ...          (add phase timings and annealing samples to every line)
+#   python -m codebreaking.batch_decrypt --patience 2000 ...      (stop once the score has not improved for 2000 steps)
+#   python -m codebreaking.batch_decrypt --polish ...             (finish every key off with steepest ascent)
+
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from .language_model import corpus_path, decode, encode, load_model, load_ngram_model
+from .schedules import AcceptanceSchedule, EarlyStop
+from .solvers import anneal, cipher_counts, frequency_key, steepest_ascent
+from .telemetry import Telemetry
+
+# The model and sample text character counts of the current batch, set once in every worker process, and how
+# long the model took to load (None when no telemetry is wanted)
+_worker_model = None
+_worker_unigram = None
+_worker_model_load = None
+
+
+def _init_worker(model, unigram, model_load):
+    global _worker_model, _worker_unigram, _worker_model_load
+    _worker_model = model
+    _worker_unigram = unigram
+    _worker_model_load = model_load
+
+
+# Decrypts one message with the model of the current worker. The cooling schedule of metropolis_ext is
+# stretched over n_iter iterations, so T still goes from 10 to 0.1, unless adaptive is set, in which case
+# schedules.AcceptanceSchedule is used. With a patience the run stops once the score has not improved for
+# that many steps. With polish the key is then finished off with steepest_ascent(). A message that cannot be
+# encoded (such as one with lower case letters or line breaks) gets an error instead of stopping the batch.
+def _decrypt(job):
+    name, message, n_iter, seed, patience, adaptive, polish = job
+    started = time.perf_counter()
+    try:
+        codes = encode(message)
+    except ValueError as error:
+        return {'id': name, 'error': str(error)}
+    observer = Telemetry() if _worker_model_load is not None else None
+    phase = observer.phase if observer else lambda name: nullcontext()
+    with phase('initial guess'):
+        counts = cipher_counts(codes, _worker_model)
+        start = frequency_key(codes, _worker_unigram)
+    with phase('annealing'):
+        schedule = AcceptanceSchedule(n_iter=n_iter) if adaptive else None
+        stop = EarlyStop(patience) if patience else None
+        key, score = anneal(counts, _worker_model, start, n_iter=n_iter, step=max(n_iter // 100, 1),
+                            rng=random.Random(seed), observer=observer, schedule=schedule, stop=stop)
+    if polish:
+        with phase('polish'):
+            key, score, swaps = steepest_ascent(counts, _worker_model, key)
+    iterations = stop.stopped_at if stop and stop.stopped_at is not None else n_iter
+    result = {'id': name, 'plaintext': decode(key[codes]), 'score': score,
+              'elapsed': time.perf_counter() - started, 'iterations': iterations}
+    if observer:
+        observer.phases['model load'] = _worker_model_load
+        result['telemetry'] = observer.to_dict()
+    return result
+
+
+# Decrypts every (name, message) pair in messages on a pool of worker processes and yields one result
+# dictionary per message, in the same order as messages. Message n uses random.Random(seed + n). If
+# model_load (the seconds it took to load the model) is given, every result also gets a 'telemetry' entry.
+# patience, adaptive and polish choose when to stop, how to cool and whether to polish, as in _decrypt().
+def decrypt_batch(messages, model, unigram, n_iter=10000, seed=0, max_workers=None, model_load=None,
+                  patience=None, adaptive=False, polish=False):
+    jobs = ((name, message, n_iter, seed + n, patience, adaptive, polish)
+            for n, (name, message) in enumerate(messages))
+    with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(model, unigram, model_load)) as pool:
+        yield from pool.map(_decrypt, jobs)
+
+
+# The (name, message) pairs to decrypt: the contents of every file in paths, or every non empty line of stdin
+def read_messages(paths):
+    if not paths:
+        for number, line in enumerate(sys.stdin, 1):
+            line = line.rstrip('\r\n')
+            if line:
+                yield 'stdin:%d' % number, line
+    for path in paths:
+        with open(path) as f:
+            yield path, f.read().rstrip('\r\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decrypt substitution ciphers and write one JSON line per message.')
+    parser.add_argument('paths', nargs='*', help='files holding one message each (default: one message per line of stdin)')
+    parser.add_argument('--corpus', default=corpus_path('english'),
+                        help='sample text of the language of the messages (default: moby.txt in the repository)')
+    parser.add_argument('--order', type=int, default=2, choices=[2, 3, 4], help='n-gram order of the language model')
+    parser.add_argument('--iterations', type=int, default=10000, help='Metropolis steps per message')
+    parser.add_argument('--patience', type=int, default=None,
+                        help='stop a message once its score has not improved for this many steps')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='steer the temperature by the fraction of accepted swaps instead of cooling at a fixed rate')
+    parser.add_argument('--polish', action='store_true', help='finish every key off with steepest ascent')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: one per core)')
+    parser.add_argument('--telemetry', action='store_true', help='add phase timings and annealing samples to the output')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    bigram_model = load_model(args.corpus)
+    model = bigram_model['log'] if args.order == 2 else load_ngram_model(args.corpus, args.order)
+    model_load = time.perf_counter() - started if args.telemetry else None
+    results = decrypt_batch(read_messages(args.paths), model, bigram_model['unigram'],
+                            n_iter=args.iterations, seed=args.seed, max_workers=args.workers, model_load=model_load,
+                            patience=args.patience, adaptive=args.adaptive, polish=args.polish)
+    for result in results:
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# Micro-benchmarks for the model building, scoring and annealing code.
+# Everything runs offline on moby.txt and monte.txt (see language_model.corpus_path()). The results are written
+# to a JSON file, and can be compared with the results of an earlier run to flag anything that has become slower.
+#
+# Usage:
+#   python -m codebreaking.benchmarks --output baseline.json                     (save a baseline)
+#   python -m codebreaking.benchmarks --output new.json --compare baseline.json  (flag regressions, exit 1 if any)
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+from .cipher_key import CipherKey
+from .language_model import (alphabet, bigram_counts, corpus_path, decode, encode, load_model, load_ngram_model,
+                            normalize_codes, score_codes)
+from .solvers import anneal, batched_anneal, cipher_counts, frequency_key
+
+# Message lengths used for the scoring benchmarks
+lengths = [100, 1000, 10000]
+
+
+# The best time per call out of `repeat` rounds of `number` calls, which is the least disturbed by other work
+def _best_time(function, number=1, repeat=5):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+# A passage of the cleaned corpus encrypted with a random key. Returns the plaintext and the ciphertext.
+def synthetic_cipher(corpus_codes, length, rng):
+    start = rng.randrange(len(corpus_codes) - length)
+    plain = corpus_codes[start:start + length]
+    key = np.arange(len(alphabet))
+    rng.shuffle(key)
+    return decode(plain), decode(np.argsort(key)[plain])
+
+
+def run_benchmarks(quick=False):
+    rng = random.Random(0)
+    repeat = 2 if quick else 5
+    results = {}
+
+    def record(name, value, unit, higher_is_better=False):
+        results[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        print('%-40s %12.6g %s' % (name, value, unit), file=sys.stderr)
+
+    # Building the models from the corpora, both from scratch and from the cache
+    corpus_codes = {}
+    for language in ['english', 'french']:
+        path = corpus_path(language)
+        name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        record('normalize/%s' % name, _best_time(lambda: normalize_codes(data), repeat=repeat), 's')
+        corpus_codes[name] = normalize_codes(data)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            record('build_model/%s' % name, _best_time(lambda: load_model(path, cache_dir), repeat=1), 's')
+            record('load_cached_model/%s' % name, _best_time(lambda: load_model(path, cache_dir), repeat=repeat),
+                   's')
+
+    model = load_model(corpus_path('english'))
+    log_matrix = model['log']
+    trigram = load_ngram_model(corpus_path('english'), 3)
+
+    # Scoring and counting messages of different lengths
+    for length in lengths:
+        plain, message = synthetic_cipher(corpus_codes['moby.txt'], length, rng)
+        codes = encode(message)
+        number = max(10000 // length, 1)
+        record('encode/%d' % length, _best_time(lambda: encode(message), number, repeat), 's')
+        record('score_codes/%d' % length, _best_time(lambda: score_codes(codes, log_matrix), number, repeat), 's')
+        record('score_codes_trigram/%d' % length, _best_time(lambda: score_codes(codes, trigram), number, repeat), 's')
+        record('bigram_counts/%d' % length, _best_time(lambda: bigram_counts(codes), number, repeat), 's')
+        key = CipherKey(frequency_key(codes, model['unigram']))
+        record('key_apply/%d' % length, _best_time(lambda: (key.swap(0, 1), key.apply(message)), number, repeat), 's')
+
+    # Metropolis steps per second, which should not depend on the message length
+    steps = 1000 if quick else 5000
+    for length in lengths:
+        plain, message = synthetic_cipher(corpus_codes['moby.txt'], length, rng)
+        codes = encode(message)
+        for name, table in [('bigram', log_matrix), ('trigram', trigram)]:
+            counts = cipher_counts(codes, table)
+            start = frequency_key(codes, model['unigram'])
+            seconds = _best_time(lambda: anneal(counts, table, start, n_iter=steps, rng=random.Random(0)),
+                                 repeat=repeat)
+            record('anneal_%s_steps_per_s/%d' % (name, length), steps / seconds, 'steps/s', higher_is_better=True)
+
+    # Steps per second summed over all the chains of batched_anneal()
+    counts = cipher_counts(codes, log_matrix)
+    start = frequency_key(codes, model['unigram'])
+    for n_chains in [8, 32]:
+        seconds = _best_time(lambda: batched_anneal(counts, log_matrix, start, n_chains, n_iter=steps // 5),
+                             repeat=repeat)
+        record('batched_anneal_chain_steps_per_s/%d' % n_chains, n_chains * (steps // 5) / seconds, 'steps/s',
+               higher_is_better=True)
+
+    # End to end decryption of synthetic ciphertexts with the metropolis_ext schedule
+    for length in [300, 1000] if quick else [300, 1000, 3000]:
+        plain, message = synthetic_cipher(corpus_codes['moby.txt'], length, rng)
+
+        def decrypt():
+            codes = encode(message)
+            key, score = anneal(cipher_counts(codes, log_matrix), log_matrix, frequency_key(codes, model['unigram']),
+                                rng=random.Random(0))
+            return decode(key[codes])
+
+        record('decrypt/%d' % length, _best_time(decrypt, repeat=repeat), 's')
+        decrypted = decrypt()
+        record('decrypt_accuracy/%d' % length, float(np.mean(np.array(list(decrypted)) == np.array(list(plain)))),
+               'fraction', higher_is_better=True)
+
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'results': results}
+
+
+# Compares two sets of results and returns the names of the benchmarks that got worse by more than tolerance
+# (0.2 means 20%), with their old and new values
+def find_regressions(baseline, current, tolerance=0.2):
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None or old['value'] == 0:
+            continue
+        change = new['value'] / old['value'] - 1
+        if new['higher_is_better'] and change < -tolerance or not new['higher_is_better'] and change > tolerance:
+            regressions.append((name, old['value'], new['value']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the scoring and annealing code.')
+    parser.add_argument('--output', default='benchmark_results.json', help='file to write the results to')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slow down before a regression is flagged')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats and shorter runs')
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.quick)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(baseline, current, args.tolerance)
+        for name, old, new in regressions:
+            print('REGRESSION %s: %.6g -> %.6g' % (name, old, new))
+        if regressions:
+            sys.exit(1)
+        print('No regressions against %s' % args.compare)
+
+
+if __name__ == '__main__':
+    main()
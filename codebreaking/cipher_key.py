@@ -0,0 +1,77 @@
+# The cipher as a key rather than as a decrypted copy of the message.
+# A CipherKey holds the 27 element permutation forward (forward[c] is the alphabet index that cipher index c
+# decrypts to) and its inverse, so swapping the roles of two characters only changes two entries of each.
+# The key is applied to text with str.translate (the translation table is built once and reused until the
+# next swap) or to encoded messages with np.take, and can be saved to a file and loaded again to decrypt other
+# messages from the same sender.
+
+import json
+
+import numpy as np
+
+from .language_model import alphabet
+
+
+class CipherKey:
+
+    def __init__(self, forward=None):
+        self.forward = np.arange(len(alphabet)) if forward is None else np.array(forward, dtype=np.intp)
+        if sorted(self.forward) != list(range(len(alphabet))):
+            raise ValueError('A key must be a permutation of the %d alphabet indexes' % len(alphabet))
+        self.inverse = np.argsort(self.forward)
+        self._table = None
+
+    # Makes a key from a dictionary mapping cipher characters to plaintext characters, such as switch(message)
+    @classmethod
+    def from_dict(cls, cipher):
+        forward = np.arange(len(alphabet))
+        for coded, decoded in cipher.items():
+            forward[alphabet.index(coded)] = alphabet.index(decoded)
+        return cls(forward)
+
+    def to_dict(self):
+        return {alphabet[c]: alphabet[p] for c, p in enumerate(self.forward)}
+
+    # Lets a CipherKey be passed anywhere a key array is expected, such as solvers.anneal()
+    def __array__(self, dtype=None, copy=None):
+        return self.forward.astype(dtype or self.forward.dtype, copy=True)
+
+    def copy(self):
+        return CipherKey(self.forward)
+
+    # Swaps the plaintext characters that cipher indexes i and j decrypt to
+    def swap(self, i, j):
+        p, q = self.forward[i], self.forward[j]
+        self.forward[i], self.forward[j] = q, p
+        self.inverse[p], self.inverse[q] = j, i
+        self._table = None
+
+    # Swaps two plaintext characters wherever they appear in the decrypted text, like swap(text, ch1, ch2)
+    def swap_plain(self, ch1, ch2):
+        self.swap(self.inverse[alphabet.index(ch1)], self.inverse[alphabet.index(ch2)])
+
+    # Decrypts a string
+    def apply(self, text):
+        if self._table is None:
+            self._table = str.maketrans(''.join(alphabet), ''.join(alphabet[p] for p in self.forward))
+        return text.translate(self._table)
+
+    # Decrypts an encoded message
+    def apply_codes(self, codes):
+        return np.take(self.forward, codes)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'cipher': ''.join(alphabet), 'plain': ''.join(alphabet[p] for p in self.forward)}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        return cls.from_dict(dict(zip(saved['cipher'], saved['plain'])))
+
+    def __eq__(self, other):
+        return isinstance(other, CipherKey) and np.array_equal(self.forward, other.forward)
+
+    def __repr__(self):
+        return 'CipherKey(%r)' % ''.join(alphabet[p] for p in self.forward)
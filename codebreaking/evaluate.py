@@ -0,0 +1,118 @@
+# Measures how accuracy depends on message length and annealing time.
+# Passages of different lengths are taken from moby.txt and monte.txt, encrypted with random keys and decrypted
+# with the model of their own language, with the cooling schedule of metropolis_ext stretched over different
+# numbers of iterations. Every trial has its own fixed seed, and the trials are shared out over a pool of
+# worker processes. For each corpus, length and iteration budget the report gives the mean fraction of
+# characters recovered, the fraction of messages solved and the mean time taken, followed by the smallest
+# budget that solves messages of each length reliably.
+#
+# Usage:
+#   python -m codebreaking.evaluate --lengths 100 200 400 --iterations 2500 5000 10000 --trials 20 --output evaluation.json
+
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .benchmarks import synthetic_cipher
+from .language_model import corpora, corpus_path, encode, load_model, normalize_codes
+from .solvers import anneal, cipher_counts, frequency_key
+
+# The cleaned corpora and models of the current worker process, loaded the first time they are needed
+_worker_corpora = {}
+
+
+def _corpus(language):
+    if language not in _worker_corpora:
+        path = corpus_path(language)
+        with open(path, 'rb') as f:
+            _worker_corpora[language] = normalize_codes(f.read()), load_model(path)
+    return _worker_corpora[language]
+
+
+# Runs one trial: encrypts a random passage of the corpus and decrypts it in n_iter iterations. Returns the
+# fraction of characters decrypted correctly and the time taken.
+def run_trial(trial):
+    language, length, n_iter, seed = trial
+    corpus_codes, model = _corpus(language)
+    rng = random.Random(seed)
+    plain, message = synthetic_cipher(corpus_codes, length, rng)
+    started = time.perf_counter()
+    codes = encode(message)
+    key, score = anneal(cipher_counts(codes, model['log']), model['log'], frequency_key(codes, model['unigram']),
+                        n_iter=n_iter, step=max(n_iter // 100, 1), rng=rng)
+    seconds = time.perf_counter() - started
+    accuracy = float(np.mean(key[codes] == encode(plain)))
+    return {'language': language, 'length': length, 'iterations': n_iter, 'seed': seed,
+            'accuracy': accuracy, 'seconds': seconds}
+
+
+# Runs `trials` trials for every language, length and iteration budget. The same seeds are used for every
+# budget, so each budget is tried on the same passages and keys.
+def evaluate(languages, lengths, budgets, trials, seed=0, max_workers=None):
+    jobs = [(language, length, n_iter, seed + n)
+            for language in languages for length in lengths for n_iter in budgets for n in range(trials)]
+    with ProcessPoolExecutor(max_workers) as pool:
+        return list(pool.map(run_trial, jobs, chunksize=max(len(jobs) // 64, 1)))
+
+
+# Groups the trial results by language, length and budget. A message counts as solved once at least
+# `solved` of its characters are decrypted correctly.
+def summarise(results, solved=0.95):
+    groups = {}
+    for result in results:
+        groups.setdefault((result['language'], result['length'], result['iterations']), []).append(result)
+    summary = []
+    for (language, length, n_iter), group in sorted(groups.items()):
+        accuracy = np.array([result['accuracy'] for result in group])
+        summary.append({'language': language, 'length': length, 'iterations': n_iter, 'trials': len(group),
+                        'mean_accuracy': float(accuracy.mean()), 'solved': float(np.mean(accuracy >= solved)),
+                        'mean_seconds': float(np.mean([result['seconds'] for result in group]))})
+    return summary
+
+
+# The smallest iteration budget for each language and length that solved at least `target` of the messages
+def recommended_budgets(summary, target=0.9):
+    budgets = {}
+    for row in summary:
+        key = row['language'], row['length']
+        if row['solved'] >= target and (key not in budgets or row['iterations'] < budgets[key]):
+            budgets[key] = row['iterations']
+    return budgets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure decryption accuracy against message length and time.')
+    parser.add_argument('--languages', nargs='+', default=list(corpora), choices=list(corpora))
+    parser.add_argument('--lengths', nargs='+', type=int, default=[50, 100, 200, 400, 800])
+    parser.add_argument('--iterations', nargs='+', type=int, default=[1000, 2500, 5000, 10000, 20000])
+    parser.add_argument('--trials', type=int, default=10, help='trials per language, length and budget')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', type=float, default=0.9, help='fraction of messages a budget must solve')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='file to write every trial and the summary to as JSON')
+    args = parser.parse_args(argv)
+
+    results = evaluate(args.languages, args.lengths, args.iterations, args.trials, args.seed, args.workers)
+    summary = summarise(results)
+    print('%-8s %7s %10s %14s %8s %10s' % ('language', 'length', 'iterations', 'mean accuracy', 'solved', 'seconds'))
+    for row in summary:
+        print('%-8s %7d %10d %14.3f %8.2f %10.3f' % (row['language'], row['length'], row['iterations'],
+                                                     row['mean_accuracy'], row['solved'], row['mean_seconds']))
+    print()
+    budgets = recommended_budgets(summary, args.target)
+    for language in args.languages:
+        for length in args.lengths:
+            budget = budgets.get((language, length))
+            print('%s, %d characters: %s' % (language, length, budget if budget else 'not solved reliably'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'trials': results, 'summary': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+# Array versions of the bigram language model used in "Mehmed 15.05.21.py".
+# Rather than slicing a message into two character strings and looking each one up in log_dict, we turn
+# every character into its position in the alphabet and keep log p(i,j) in a 27x27 matrix, so that the
+# plausibility score of a whole message is a single NumPy gather and sum.
+
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# The same 27 characters as in Section 1, upper case letters followed by the space character
+alphabet = ['A','B','C','D','E','F','G','H','I','J','K','L','M','N','O','P','Q','R','S','T','U','V','W','X','Y','Z',chr(32)]
+
+# Lookup table from a byte value to its index in the alphabet (-1 for characters not in the alphabet)
+_code_table = np.full(256, -1, dtype=np.int16)
+for index, letter in enumerate(alphabet):
+    _code_table[ord(letter)] = index
+
+# The alphabet as a byte array, so that a row of indexes can be turned back into text with one gather
+_alphabet_bytes = np.frombuffer(''.join(alphabet).encode('ascii'), dtype=np.uint8)
+
+
+# Takes a string made of alphabet characters and returns an integer array of alphabet indexes
+def encode(message):
+    codes = _code_table[np.frombuffer(message.encode('ascii', errors='replace'), dtype=np.uint8)]
+    if (codes < 0).any():
+        raise ValueError('The message contains characters that are not in the alphabet')
+    return codes.astype(np.intp)
+
+
+# Takes an integer array of alphabet indexes and returns the string it represents
+def decode(codes):
+    return _alphabet_bytes[np.asarray(codes)].tobytes().decode('ascii')
+
+
+# The order of a model: 2 for a 27x27 log matrix (or the same 729 values as a flat array), 3 for a flat
+# trigram table of 27**3 values and 4 for a flat quadgram table of 27**4 values
+def model_order(model):
+    return {len(alphabet) ** order: order for order in range(2, 5)}[np.size(model)]
+
+
+# Takes an encoded text and returns, for every window of `order` consecutive characters, its position in a
+# flat n-gram table: the window's indexes read as the digits of a number in base 27
+def ngram_indexes(codes, order):
+    codes = np.asarray(codes, dtype=np.intp)
+    n = len(codes) - order + 1
+    index = np.zeros(max(n, 0), dtype=np.intp)
+    for k in range(order):
+        index = index * len(alphabet) + codes[k:k + len(index)]
+    return index
+
+
+# The plausibility score of an encoded message: every n-gram of the message (every bigram for the log
+# matrix) picks one entry of the model and the entries are summed
+def score_codes(codes, model):
+    return float(np.ravel(model)[ngram_indexes(codes, model_order(model))].sum(dtype=np.float64))
+
+
+# Takes an encoded text and returns the 27x27 matrix whose [i, j] entry is the number of times alphabet
+# character i is followed by alphabet character j
+def bigram_counts(codes):
+    codes = np.asarray(codes)
+    pairs = codes[:-1] * len(alphabet) + codes[1:]
+    return np.bincount(pairs, minlength=len(alphabet) ** 2).reshape(len(alphabet), len(alphabet))
+
+
+# The corpus clean up from Section 2 (upper case everything, anything that is not a letter, hyphen or
+# apostrophe becomes a single space, then the hyphens and apostrophes are removed) done in one pass over the
+# raw bytes. Every byte is first given a class: its alphabet index for a letter, _other for a byte that
+# becomes a space and _dropped for hyphens and apostrophes. Non ASCII characters are made of bytes of class
+# _other, so like the regular expressions they turn into a single space.
+_other = alphabet.index(' ')
+_dropped = len(alphabet)
+_class_table = np.full(256, _other, dtype=np.uint8)
+for index, letter in enumerate(alphabet[:-1]):
+    _class_table[ord(letter)] = index
+    _class_table[ord(letter.lower())] = index
+for punctuation in '-\'"':
+    _class_table[ord(punctuation)] = _dropped
+
+
+# Turns raw bytes into the alphabet indexes of the cleaned text. after_space says whether the bytes just before
+# data ended in a run of _other bytes, so that text read in pieces is cleaned exactly as it would be in one go.
+def normalize_codes(data, after_space=False):
+    classes = _class_table[np.frombuffer(data, dtype=np.uint8)]
+    other = classes == _other
+    # Only the first byte of every run of _other bytes is kept
+    repeated = np.empty_like(other)
+    repeated[:1] = after_space
+    repeated[1:] = other[:-1]
+    classes = classes[~(other & repeated)]
+    return classes[classes != _dropped].astype(np.intp)
+
+
+# The string version of normalize_codes(). This gives exactly the same result as the two re.sub calls used in
+# Section 2 on upper cased text, apart from the few non ASCII characters that upper case to ASCII letters.
+def normalize(text):
+    return decode(normalize_codes(text.encode('utf-8')))
+
+
+# Bump this whenever the layout or the calculation of the saved models changes, so old cache files are ignored
+MODEL_VERSION = 1
+
+# A compiled model is a single record holding the character counts, the bigram counts and the log p(i,j) table
+model_dtype = np.dtype([('unigram', np.int64, (len(alphabet),)),
+                        ('bigram', np.int64, (len(alphabet), len(alphabet))),
+                        ('log', np.float64, (len(alphabet), len(alphabet)))])
+
+
+# Builds a model from character and bigram counts. As in Section 5, p(i,j) = (frequency(ij)+1)/frequency(i),
+# where a bigram missing from the text has a frequency of 0
+def model_from_counts(unigram, bigram):
+    model = np.zeros((), dtype=model_dtype)
+    model['unigram'] = unigram
+    model['bigram'] = bigram
+    model['log'] = np.log((model['bigram'] + 1) / model['unigram'][:, None])
+    return model
+
+
+# Builds the model of a normalised text
+def build_model(text):
+    codes = encode(text)
+    return model_from_counts(np.bincount(codes, minlength=len(alphabet)), bigram_counts(codes))
+
+
+# Generalises p(i,j) to longer n-grams: the probability that the first order-1 characters of an n-gram are
+# followed by its last character is (frequency(n-gram)+1)/frequency(first order-1 characters). For order 2
+# this is exactly the bigram formula. If the first order-1 characters never appear in the text at all, the
+# total number of (order-1)-grams is used as their frequency, so such n-grams are scored as the least likely.
+# The log probabilities are returned as a flat float32 array of 27**order values (about 2 MB for order 4).
+def build_ngram_model(codes, order):
+    counts = np.bincount(ngram_indexes(codes, order), minlength=len(alphabet) ** order)
+    prefix = np.bincount(ngram_indexes(codes, order - 1), minlength=len(alphabet) ** (order - 1))
+    prefix = np.where(prefix > 0, prefix, max(prefix.sum(), 1))
+    return np.log((counts.reshape(-1, len(alphabet)) + 1) / prefix[:, None]).astype(np.float32).ravel()
+
+
+# The folder holding the sample texts of corpora: the CODEBREAKING_DATA environment variable if it is set,
+# otherwise the folder the codebreaking package is in, so they are found whatever the working directory is
+def default_data_dir():
+    return os.environ.get('CODEBREAKING_DATA') or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# The folder the compiled models are cached in: the CODEBREAKING_CACHE environment variable if it is set,
+# otherwise model_cache in default_data_dir()
+def default_cache_dir():
+    return os.environ.get('CODEBREAKING_CACHE') or os.path.join(default_data_dir(), 'model_cache')
+
+
+# Loads the cached array called `kind` for the corpus text file at path, or calls build(data) on the file's
+# bytes and saves the result first. The cache file name is made from the corpus name, kind, MODEL_VERSION and a
+# hash of the file contents, so it is only rebuilt when the corpus changes. The saved file is memory mapped
+# rather than read into memory. cache_dir defaults to default_cache_dir().
+def _load_cached(path, kind, build, cache_dir):
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_dir, '%s-%s-v%d-%s.npy' % (name, kind, MODEL_VERSION, digest))
+    if not os.path.exists(cache_path):
+        array = build(data)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file first so another process never loads a half written model
+        temp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, cache_path)
+    return np.load(cache_path, mmap_mode='r')
+
+
+def _build_bigram_model(data):
+    codes = normalize_codes(data)
+    return model_from_counts(np.bincount(codes, minlength=len(alphabet)), bigram_counts(codes))
+
+
+# Returns the compiled bigram model of the corpus text file at path
+def load_model(path, cache_dir=None):
+    return _load_cached(path, 'bigram', _build_bigram_model, cache_dir)
+
+
+# Returns the flat n-gram table of the given order (2 to 4) for the corpus text file at path
+def load_ngram_model(path, order, cache_dir=None):
+    return _load_cached(path, '%dgram' % order, lambda data: build_ngram_model(normalize_codes(data), order),
+                        cache_dir)
+
+
+# The words of an encoded text that appear at least min_count times, as a frozen set of strings. Words seen
+# only once are left out, as in a long book these are mostly misspellings and names.
+def build_lexicon(codes, min_count=2):
+    words, counts = np.unique(decode(codes).split(), return_counts=True)
+    return frozenset(words[counts >= min_count].tolist())
+
+
+# Returns the lexicon of the corpus text file at path. It is cached with the models, as one byte array of the
+# sorted words separated by spaces (about 80 KB for Moby Dick), and turned back into a frozen set on loading.
+def load_lexicon(path, cache_dir=None):
+    array = _load_cached(path, 'lexicon', lambda data: np.frombuffer(
+        ' '.join(sorted(build_lexicon(normalize_codes(data)))).encode('ascii'), dtype=np.uint8), cache_dir)
+    return frozenset(array.tobytes().decode('ascii').split())
+
+
+# The fraction of the words of a decrypted text (a string or encoded message) that are in lexicon. A correct
+# decryption of an ordinary text scores close to 1, while a text that merely has plausible bigrams rarely
+# gets above a half.
+def word_hit_rate(text, lexicon):
+    words = (text if isinstance(text, str) else decode(text)).split()
+    if not words:
+        return 0.0
+    return sum(word in lexicon for word in words) / len(words)
+
+
+# Counts the characters and bigrams of bytes start to stop of a corpus file, reading chunk_size bytes at a time,
+# so the whole corpus never has to be held in memory. The counts are the same as those of normalize_codes() on
+# the whole file. Two things are carried over from one chunk to the next: whether the chunk ended in a run of
+# bytes that become a space, so a run split between two chunks still becomes one space, and the last index
+# of the cleaned text, so the bigram across the join is counted. A shard that does not start at the beginning
+# of the file must start straight after an ASCII letter (see shard_boundaries()), which is then used as the
+# character before it.
+def count_stream(path, start=0, stop=None, chunk_size=1 << 20):
+    unigram = np.zeros(len(alphabet), dtype=np.int64)
+    bigram = np.zeros((len(alphabet), len(alphabet)), dtype=np.int64)
+    after_space, last_code = False, None
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            last_code = int(_class_table[f.read(1)[0]])
+        if stop is None:
+            stop = os.path.getsize(path)
+        position = start
+        while position < stop:
+            data = f.read(min(chunk_size, stop - position))
+            if not data:
+                break
+            position += len(data)
+            codes = normalize_codes(data, after_space)
+            after_space = _class_table[data[-1]] == _other
+            if len(codes):
+                if last_code is not None:
+                    bigram[last_code, codes[0]] += 1
+                unigram += np.bincount(codes, minlength=len(alphabet))
+                bigram += bigram_counts(codes)
+                last_code = codes[-1]
+    return unigram, bigram
+
+
+# Splits a corpus file into about n_shards byte ranges for count_stream(). Every boundary is moved forward to
+# just after the next ASCII letter, which is always a whole character and needs no cleaning.
+def shard_boundaries(path, n_shards):
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        for n in range(1, n_shards):
+            position = max(size * n // n_shards, boundaries[-1])
+            f.seek(position)
+            while True:
+                block = f.read(1 << 16)
+                match = re.search(rb'[A-Za-z]', block)
+                if match:
+                    position += match.end()
+                    break
+                position += len(block)
+                if not block:
+                    break
+            if position >= size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _count_shard(shard):
+    path, start, stop, chunk_size = shard
+    return count_stream(path, start, stop, chunk_size)
+
+
+# Counts the characters and bigrams of one or more corpus files, split into shards that are counted in
+# parallel worker processes. Counts of different shards and different files are simply added together, so
+# bigrams across the end of one file and the start of the next are not counted. Returns a model record.
+def build_model_from_files(paths, n_shards=None, chunk_size=1 << 20, max_workers=None):
+    if n_shards is None:
+        n_shards = os.cpu_count()
+    shards = [(path, start, stop, chunk_size) for path in paths for start, stop in shard_boundaries(path, n_shards)]
+    unigram = np.zeros(len(alphabet), dtype=np.int64)
+    bigram = np.zeros((len(alphabet), len(alphabet)), dtype=np.int64)
+    with ProcessPoolExecutor(max_workers) as pool:
+        for shard_unigram, shard_bigram in pool.map(_count_shard, shards):
+            unigram += shard_unigram
+            bigram += shard_bigram
+    return model_from_counts(unigram, bigram)
+
+
+# The sample text of every language we have a model for
+corpora = {'english': 'moby.txt', 'french': 'monte.txt'}
+
+
+# The path of the sample text of language, in data_dir (by default default_data_dir())
+def corpus_path(language, data_dir=None):
+    return os.path.join(data_dir or default_data_dir(), corpora[language])
+
+
+# Loads the bigram model of every language in corpora (or only those in names)
+def load_models(names=None, cache_dir=None):
+    return {name: load_model(corpus_path(name), cache_dir) for name in (names or corpora)}
+
+
+# A fingerprint of a text that a substitution cipher does not change: the relative frequencies of its 27
+# characters and of its most common bigrams, each sorted from the most to the least common. Which character
+# has which frequency is scrambled by the cipher, but the sorted lists of frequencies are not. Only the top
+# n_bigrams bigrams are used, at half weight, as the rare ones are mostly noise for short messages.
+def frequency_profile(unigram, bigram, n_bigrams=50):
+    unigram = np.sort(np.asarray(unigram, dtype=np.float64).ravel())[::-1]
+    bigram = np.sort(np.asarray(bigram, dtype=np.float64).ravel())[::-1]
+    return np.concatenate([unigram / max(unigram.sum(), 1), 0.5 * bigram[:n_bigrams] / max(bigram.sum(), 1)])
+
+
+# Ranks the languages of models (a dictionary of name: model) by how close their frequency profiles are to the
+# profile of an encoded message. The profiles of all the languages are stacked into one array, so the
+# distances to all of them are worked out together. Returns a list of (name, distance), closest first.
+def rank_languages(codes, models):
+    names = list(models)
+    profiles = np.stack([frequency_profile(models[name]['unigram'], models[name]['bigram']) for name in names])
+    message = frequency_profile(np.bincount(codes, minlength=len(alphabet)), bigram_counts(codes))
+    distances = np.abs(profiles - message).sum(axis=1)
+    return [(names[n], float(distances[n])) for n in np.argsort(distances)]
@@ -0,0 +1,59 @@
+# The language models and lexicons, loaded the first time they are asked for and then kept for the life of the
+# process. They are read from the model cache (see language_model.load_model()), which is built from the
+# sample texts the first time. The sample texts and the cache are looked for in the repository (or wherever the
+# CODEBREAKING_DATA and CODEBREAKING_CACHE environment variables point), not in the working directory, and
+# nothing is ever downloaded on the way: a missing sample text is an error, and fetch_corpus() has to be called
+# to download it from Project Gutenberg as in Section 2 of the notebook, so requests is imported only then.
+
+import os
+
+from .language_model import corpora, corpus_path, default_cache_dir, load_lexicon, load_model, load_ngram_model
+
+# Where the sample text of every language in language_model.corpora comes from
+corpus_urls = {'english': 'https://www.gutenberg.org/files/2701/2701-0.txt',
+               'french': 'https://www.gutenberg.org/cache/epub/17989/pg17989.txt'}
+
+_models = {}
+_lexicons = {}
+
+
+# Downloads the sample text of language and saves it upper cased to its file in data_dir (by default
+# language_model.default_data_dir()), as in Section 2
+def fetch_corpus(language, data_dir=None):
+    import requests
+    response = requests.get(corpus_urls[language])
+    response.raise_for_status()
+    with open(corpus_path(language, data_dir), 'w', errors='ignore') as f:
+        f.write(response.text.upper())
+
+
+def _corpus_path(language, data_dir):
+    path = corpus_path(language, data_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError('The %s sample text %s is missing; download it with codebreaking.fetch_corpus(%r) '
+                                'or set CODEBREAKING_DATA to the folder holding it' % (language, path, language))
+    return path
+
+
+# The bigram model of language (order 2), or its flat n-gram table of order 3 or 4. cache_dir and data_dir
+# default to language_model.default_cache_dir() and default_data_dir().
+def get_model(language='english', order=2, cache_dir=None, data_dir=None):
+    path = _corpus_path(language, data_dir)
+    cache_dir = cache_dir or default_cache_dir()
+    if (path, order, cache_dir) not in _models:
+        _models[path, order, cache_dir] = (load_model(path, cache_dir) if order == 2
+                                           else load_ngram_model(path, order, cache_dir))
+    return _models[path, order, cache_dir]
+
+
+# The bigram model of every language in corpora, as a dictionary like language_model.load_models() returns
+def get_models(cache_dir=None, data_dir=None):
+    return {language: get_model(language, cache_dir=cache_dir, data_dir=data_dir) for language in corpora}
+
+
+def get_lexicon(language='english', cache_dir=None, data_dir=None):
+    path = _corpus_path(language, data_dir)
+    cache_dir = cache_dir or default_cache_dir()
+    if (path, cache_dir) not in _lexicons:
+        _lexicons[path, cache_dir] = load_lexicon(path, cache_dir)
+    return _lexicons[path, cache_dir]
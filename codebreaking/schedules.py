@@ -0,0 +1,134 @@
+# Temperature schedules and stopping rules for solvers.anneal().
+# A schedule is called every schedule.every steps with the step number and the fraction of swaps accepted since
+# the last call (counting only swaps that change the decryption), and returns the temperature for the next schedule.every steps. start() is called at the
+# beginning of every run. A stopping rule is checked at the same points, with the step number, the best score
+# and the best key, and ends the run early once the best score has stopped improving or the best key is good
+# enough.
+
+import math
+import time
+
+from .language_model import word_hit_rate
+
+
+# The schedule of metropolis_ext: T is multiplied by a every `every` steps, starting with the first step
+# (a = 1 keeps T fixed as in metropolis)
+class GeometricSchedule:
+
+    def __init__(self, T=10, a=0.01**(1/100), every=100):
+        self.T0 = T
+        self.a = a
+        self.every = every
+
+    def start(self):
+        self.T = self.T0
+
+    def __call__(self, n, acceptance):
+        self.T = self.T*self.a
+        return self.T
+
+
+# A schedule that steers T so that the fraction of accepted swaps follows a target, which falls geometrically
+# from `high` to `low` over n_iter steps. If fewer swaps than the target are accepted T is raised, if more are
+# accepted it is lowered, by at most a factor of `limit` each time. An easy message settles at a low acceptance
+# rate early on, so the run cools quickly, while a hard one keeps T up for longer. T is never lowered below
+# T_min, the final temperature of metropolis_ext, as below that the run is only a greedy search.
+class AcceptanceSchedule:
+
+    def __init__(self, T=10, high=0.3, low=0.002, n_iter=10000, every=100, limit=1.5, T_min=0.1):
+        self.T0 = T
+        self.high = high
+        self.low = low
+        self.n_iter = n_iter
+        self.every = every
+        self.limit = limit
+        self.T_min = T_min
+
+    def start(self):
+        self.T = self.T0
+
+    def __call__(self, n, acceptance):
+        if n > 0:
+            target = self.high * (self.low / self.high) ** min(n / self.n_iter, 1)
+            ratio = (target + 1e-3) / (acceptance + 1e-3)
+            self.T = max(self.T * min(max(ratio, 1 / self.limit), self.limit), self.T_min)
+        return self.T
+
+
+# Stops a run once the best score has not improved for `patience` steps or for `seconds` seconds (either can be
+# None), but never before min_iterations steps. stopped_at is the step the last run stopped at, or None if it
+# ran to the end.
+class EarlyStop:
+
+    def __init__(self, patience=2000, seconds=None, min_iterations=0):
+        self.patience = patience
+        self.seconds = seconds
+        self.min_iterations = min_iterations
+        self.stopped_at = None
+
+    def start(self):
+        self.stopped_at = None
+        self._best = -math.inf
+        self._best_step = 0
+        self._best_time = time.perf_counter()
+
+    # Called with the step number and the best score and key so far, returns True when the run should stop
+    def __call__(self, n, best, key=None):
+        now = time.perf_counter()
+        if best > self._best:
+            self._best, self._best_step, self._best_time = best, n, now
+            return False
+        if n < self.min_iterations:
+            return False
+        if (self.patience is not None and n - self._best_step >= self.patience
+                or self.seconds is not None and now - self._best_time >= self.seconds):
+            self.stopped_at = n
+            return True
+        return False
+
+
+# Stops a run as soon as the best key decrypts codes (the encoded message) into text of which at least
+# `threshold` of the words are in lexicon (see language_model.word_hit_rate()). The words are only checked
+# again when the best score has improved.
+class WordStop:
+
+    def __init__(self, codes, lexicon, threshold=0.9, min_iterations=0):
+        self.codes = codes
+        self.lexicon = lexicon
+        self.threshold = threshold
+        self.min_iterations = min_iterations
+        self.stopped_at = None
+
+    def start(self):
+        self.stopped_at = None
+        self._checked = -math.inf
+
+    def __call__(self, n, best, key=None):
+        if n < self.min_iterations or best <= self._checked:
+            return False
+        self._checked = best
+        if word_hit_rate(key[self.codes], self.lexicon) >= self.threshold:
+            self.stopped_at = n
+            return True
+        return False
+
+
+# Stops a run as soon as any of the given stopping rules would
+class AnyStop:
+
+    def __init__(self, *rules):
+        self.rules = rules
+        self.stopped_at = None
+
+    def start(self):
+        self.stopped_at = None
+        for rule in self.rules:
+            rule.start()
+
+    def __call__(self, n, best, key=None):
+        # Every rule is called, so each one keeps track of the best score
+        stops = [rule(n, best, key) for rule in self.rules]
+        if any(stops):
+            self.stopped_at = n
+            return True
+        return False
@@ -0,0 +1,291 @@
+# A long running local decryption service.
+# The English and French models are loaded once when the server starts, in the server and in every worker
+# process, so a request only pays for the annealing itself. Requests are taken over HTTP on localhost or on
+# a Unix socket and put in a queue. Whenever a worker is free it is sent the first job in the queue, together
+# with its share of the jobs waiting behind it when the server is behind (the queue divided by the number of
+# workers, at most batch_size), so a backlog of small requests costs fewer round trips to the pool while the
+# other workers still get their part as soon as they are free. The worker hands back the result of every job
+# as soon as it is done, not at the end of the batch. If a worker process dies, the jobs it had not answered
+# yet get an error and the pool is started again for the requests after them.
+#
+#   POST /decrypt   {"message": "...", "language": "english", "iterations": 10000, "seconds": 0.5, "seed": 0}
+#                   (only message is needed) answers {"plaintext", "language", "score", "solve_seconds",
+#                   "latency"}, or {"error"} with status 400
+#   GET /metrics    queue depth, batches in flight, counts and latency percentiles
+#
+# Usage:
+#   python -m codebreaking.server --port 8765
+#   python -m codebreaking.server --unix /tmp/codebreaking.sock
+#   curl -d '{"message": "..."}' http://127.0.0.1:8765/decrypt
+
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .api import decrypt
+from .models import get_models
+
+_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+# How long to wait for the results a failed pool had already sent before failing the jobs left
+_drain_seconds = 1.0
+
+
+# The queue a worker process puts its results on, set once in every worker process
+_worker_results = None
+
+
+# Loads the models into a worker process before its first batch
+def _init_worker(results=None):
+    global _worker_results
+    if results is not None:
+        _worker_results = results
+    get_models()
+
+
+# Decrypts one job. A job that cannot be decrypted (such as a message with characters outside the alphabet)
+# gets an error.
+def _decrypt_job(job):
+    started = time.perf_counter()
+    try:
+        plaintext, language, score = decrypt(job['message'], job.get('language'), job.get('seconds'),
+                                             job.get('iterations', 10000), job.get('seed', 0))
+    except (KeyError, TypeError, ValueError) as error:
+        return {'error': str(error) or type(error).__name__}
+    return {'plaintext': plaintext, 'language': language, 'score': score,
+            'solve_seconds': time.perf_counter() - started}
+
+
+# Decrypts a batch of jobs in a worker process, putting (batch_id, n, result) on the results queue as soon as
+# job n is done. Any other error also goes on the queue, behind the results before it, so a job that fails
+# does not take the rest of the batch with it.
+def _decrypt_batch(batch_id, jobs):
+    for n, job in enumerate(jobs):
+        try:
+            result = _decrypt_job(job)
+        except Exception as error:
+            result = {'error': 'worker failed: %s' % (error or type(error).__name__)}
+        _worker_results.put((batch_id, n, result))
+
+
+# The value below which a fraction q of the sorted values lie
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class DecryptionServer:
+
+    def __init__(self, max_workers=None, batch_size=8, history=1000):
+        self.batch_size = batch_size
+        self.max_workers = max_workers or os.cpu_count()
+        self._new_pool()
+        # The results queues of the pools that broke, whose readers are stopped on close()
+        self._broken_results = []
+        self.queue = None
+        # The jobs of every batch still running, by batch number, and how many of them are not answered yet
+        self.pending = {}
+        self.next_batch = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        # The latencies (from arriving to being answered) and solve times of the last `history` requests
+        self.latencies = deque(maxlen=history)
+        self.solve_times = deque(maxlen=history)
+
+    # Starts the batcher; the models are loaded here and by every worker process before the first request
+    async def start(self):
+        get_models()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, _init_worker) for _ in range(self.max_workers)])
+        self.queue = asyncio.Queue()
+        self._free = asyncio.Semaphore(self.max_workers)
+        self._batcher = asyncio.create_task(self._run_batches())
+        self._start_reader(loop)
+
+    # Waits for the batches already running (in a thread, so requests still being answered are not held up)
+    async def close(self):
+        self._batcher.cancel()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self.pool.shutdown, cancel_futures=True))
+        for results in self._broken_results + [self.results]:
+            results.put(None)
+        await loop.run_in_executor(None, self._reader.join)
+
+    # A new pool of worker processes with its own results queue. The queue of a broken pool is not reused, as
+    # a worker killed while putting on it can leave it locked.
+    def _new_pool(self):
+        self.results = multiprocessing.Queue()
+        self.pool = ProcessPoolExecutor(self.max_workers, initializer=_init_worker, initargs=(self.results,))
+
+    def _start_reader(self, loop):
+        self._reader = threading.Thread(target=self._read_results, args=(self.results, loop), daemon=True)
+        self._reader.start()
+
+    # Runs in a thread, passing every result the workers put on a results queue to the event loop
+    def _read_results(self, results, loop):
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            loop.call_soon_threadsafe(self._finish, *item)
+
+    # Queues a job and waits for its result
+    async def submit(self, job):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((job, future, time.perf_counter()))
+        return await future
+
+    # Waits for a free worker and a first job, then adds this worker's share of the jobs queued behind it. The
+    # share is worked out over all the workers, not only the free ones, so a worker that is free a moment
+    # before the others does not take the whole backlog.
+    async def _run_batches(self):
+        while True:
+            await self._free.acquire()
+            batch = [await self.queue.get()]
+            share = min(self.batch_size, -(-(1 + self.queue.qsize()) // self.max_workers))
+            while len(batch) < share:
+                batch.append(self.queue.get_nowait())
+            self.in_flight += 1
+            self.batches += 1
+            self.batched_jobs += len(batch)
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        batch_id = self.next_batch
+        self.next_batch += 1
+        self.pending[batch_id] = [batch, len(batch)]
+        loop = asyncio.get_running_loop()
+        pool, results = self.pool, self.results
+        try:
+            await loop.run_in_executor(pool, _decrypt_batch, batch_id, [job for job, future, arrived in batch])
+        except Exception as error:
+            # The pool itself has failed, most likely because a worker process died, and the results sent
+            # before that may still be on the queue. A marker is put on the queue behind them, and only the
+            # jobs still unanswered when it comes out (or after _drain_seconds if it never does) are failed.
+            result = {'error': 'worker failed: %s' % (error or type(error).__name__)}
+            if isinstance(error, BrokenProcessPool) and pool is self.pool:
+                self._broken_results.append(results)
+                self._new_pool()
+                self._start_reader(loop)
+                pool.shutdown(wait=False)
+            results.put((batch_id, None, result))
+            loop.call_later(_drain_seconds, self._finish, batch_id, None, result)
+        finally:
+            self.in_flight -= 1
+            self._free.release()
+
+    # Answers job n of a batch with its result, or every job of the batch not answered yet if n is None
+    def _finish(self, batch_id, n, result):
+        if batch_id not in self.pending:
+            return
+        batch, left = self.pending[batch_id]
+        if n is None:
+            for n, (job, future, arrived) in enumerate(batch):
+                if not future.done():
+                    self._finish(batch_id, n, dict(result))
+            return
+        job, future, arrived = batch[n]
+        if future.done():
+            return
+        if 'error' in result:
+            self.failed += 1
+        else:
+            self.completed += 1
+            self.solve_times.append(result['solve_seconds'])
+            result['latency'] = time.perf_counter() - arrived
+            self.latencies.append(result['latency'])
+        future.set_result(result)
+        if left == 1:
+            del self.pending[batch_id]
+        else:
+            self.pending[batch_id][1] = left - 1
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        solve_times = sorted(self.solve_times)
+        return {'queue_depth': self.queue.qsize(), 'batches_in_flight': self.in_flight,
+                'workers': self.max_workers, 'completed': self.completed, 'failed': self.failed,
+                'batches': self.batches, 'mean_batch_size': self.batched_jobs / self.batches if self.batches else None,
+                'latency': {'p50': _percentile(latencies, 0.5), 'p95': _percentile(latencies, 0.95),
+                            'p99': _percentile(latencies, 0.99)},
+                'solve_seconds': {'p50': _percentile(solve_times, 0.5), 'p95': _percentile(solve_times, 0.95)}}
+
+    # Answers one HTTP request on a connection, then closes it
+    async def handle(self, reader, writer):
+        try:
+            status, body = await self._respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            status, body = 400, {'error': 'malformed request'}
+        data = json.dumps(body).encode()
+        writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                     b'Connection: close\r\n\r\n' % (status, _reasons[status].encode(), len(data)) + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _respond(self, reader):
+        method, path, version = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if path == '/metrics':
+            return 200, self.metrics()
+        if path != '/decrypt':
+            return 404, {'error': 'unknown path %s' % path}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        job = json.loads(await reader.readexactly(int(headers.get('content-length', 0))))
+        if not isinstance(job, dict) or not isinstance(job.get('message'), str):
+            return 400, {'error': 'the body must be a JSON object with a message'}
+        result = await self.submit(job)
+        return (400 if 'error' in result else 200), result
+
+
+async def serve(host='127.0.0.1', port=8765, unix=None, **options):
+    server = DecryptionServer(**options)
+    await server.start()
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve decryptions over local HTTP with the models kept loaded.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: one per core)')
+    parser.add_argument('--batch-size', type=int, default=8, help='most jobs sent to a worker at once')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, max_workers=args.workers, batch_size=args.batch_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
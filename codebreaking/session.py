@@ -0,0 +1,76 @@
+# Hand polishing of a decryption, as done by readable() in the notebook, without the input() loop.
+# A ReadableSession keeps the key and the bigram (or n-gram) counts of the ciphertext, so a swap only changes
+# two entries of the key and the plausibility score is updated with swap_delta() instead of being worked out
+# again from the whole text. After every swap it can suggest the swaps that would raise the score the most,
+# found from all 351 possible swaps at once, and every swap can be undone and redone.
+
+import numpy as np
+
+from .cipher_key import CipherKey
+from .language_model import alphabet, encode
+from .solvers import all_swap_deltas, cipher_counts, key_score, swap_delta
+
+
+class ReadableSession:
+
+    # key is a CipherKey (which is copied, so the caller's key is not changed) or a key array
+    def __init__(self, message, model, key=None):
+        self.message = message
+        self.model = model
+        self.counts = cipher_counts(encode(message), model)
+        self.key = CipherKey() if key is None else CipherKey(np.asarray(key))
+        self.score = key_score(self.counts, model, self.key.forward)
+        # The swaps made so far as (i, j, ch1, ch2, score before, score after), with cipher indexes and plaintext
+        # characters. The scores are kept so that undo() and redo() restore them exactly, without rounding drift.
+        self._done = []
+        self._undone = []
+
+    # The message decrypted with the current key
+    @property
+    def text(self):
+        return self.key.apply(self.message)
+
+    # The plaintext character pairs swapped so far, in order
+    @property
+    def swaps(self):
+        return [(ch1, ch2) for i, j, ch1, ch2, before, after in self._done]
+
+    # Swaps two plaintext characters wherever they appear in the decrypted text, like swap(text, ch1, ch2).
+    # Returns the change in plausibility score.
+    def swap_plain(self, ch1, ch2):
+        i, j = self.key.inverse[alphabet.index(ch1)], self.key.inverse[alphabet.index(ch2)]
+        delta = swap_delta(self.counts, self.model, self.key.forward, i, j)
+        self.key.swap(i, j)
+        self._done.append((i, j, ch1, ch2, self.score, self.score + delta))
+        self._undone.clear()
+        self.score += delta
+        return delta
+
+    # Undoes the last swap (or redoes the last undone one). Returns False if there is nothing to undo (redo).
+    def undo(self):
+        if not self._done:
+            return False
+        swap = self._done.pop()
+        self.key.swap(swap[0], swap[1])
+        self.score = swap[4]
+        self._undone.append(swap)
+        return True
+
+    def redo(self):
+        if not self._undone:
+            return False
+        swap = self._undone.pop()
+        self.key.swap(swap[0], swap[1])
+        self.score = swap[5]
+        self._done.append(swap)
+        return True
+
+    # The k swaps that would raise the plausibility score the most, best first, as (ch1, ch2, change in score)
+    # where ch1 and ch2 are plaintext characters as passed to swap_plain(). Only swaps that raise the score are
+    # given, so the list is shorter than k, or empty, once the key is at or near a local optimum.
+    def suggestions(self, k=5):
+        i, j, deltas = all_swap_deltas(self.counts, self.model, self.key.forward)
+        top = np.argsort(-deltas, kind='stable')[:k]
+        top = top[deltas[top] > 0]
+        plain = self.key.forward
+        return [(alphabet[plain[i[n]]], alphabet[plain[j[n]]], float(deltas[n])) for n in top]
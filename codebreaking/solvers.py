@@ -0,0 +1,482 @@
+# Metropolis engines that work on the cipher key instead of on the decrypted text.
+# The ciphertext is only read once, to count how often each pair of cipher characters appears next to each
+# other. A key is a permutation of the 27 alphabet indexes (key[c] is the plaintext index for cipher index c),
+# so the plausibility score of a key is sum over a,b of counts[a,b] * log_matrix[key[a], key[b]]. Swapping
+# two characters only changes the rows and columns of the counts matrix for those two cipher characters,
+# which means each Metropolis step costs the same however long the message is.
+# The same functions accept the longer n-gram tables of language_model.build_ngram_model(). For those, the
+# counts are the distinct n-grams of the ciphertext and a swap rescores only the n-grams that contain one of
+# the two swapped characters.
+
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+
+from .language_model import alphabet, bigram_counts, model_order, ngram_indexes, rank_languages, word_hit_rate
+from .schedules import GeometricSchedule
+
+
+# The cipher characters of an encoded message sorted from the least to the most common, with their counts. As
+# in char_freq(), characters tied on frequency stay in the order in which they first appear in the message,
+# followed by the characters missing from the message in alphabet order.
+def frequency_order(codes):
+    codes = np.asarray(codes)
+    present, first = np.unique(codes, return_index=True)
+    missing = np.setdiff1d(np.arange(len(alphabet)), present)
+    order = np.concatenate([present[np.argsort(first)], missing]).astype(np.intp)
+    counts = np.bincount(codes, minlength=len(alphabet))
+    return order[np.argsort(counts[order], kind='stable')], counts
+
+
+# The starting key of first_try(): the cipher characters sorted by how often they appear in the message are
+# matched with the alphabet characters sorted by how often they appear in the sample text (unigram holds the
+# sample text's character counts)
+def frequency_key(codes, unigram):
+    cipher, counts = frequency_order(codes)
+    key = np.empty(len(alphabet), dtype=np.intp)
+    key[cipher] = np.argsort(np.asarray(unigram), kind='stable')
+    return key
+
+
+# The distinct n-grams of an encoded message. Returns a tuple of: an (m, order) array holding the cipher
+# indexes of each distinct n-gram, how many times each one appears, and a (27, m) array saying which of them
+# contain each cipher character
+def ngram_counts(codes, order):
+    windows, counts = np.unique(ngram_indexes(codes, order), return_counts=True)
+    digits = windows[:, None] // len(alphabet) ** np.arange(order - 1, -1, -1) % len(alphabet)
+    contains = (digits[None, :, :] == np.arange(len(alphabet))[:, None, None]).any(axis=2)
+    return digits, counts, contains
+
+
+# The counts of an encoded message needed to score keys against model: the 27x27 bigram counts matrix for a
+# bigram model, or the ngram_counts() tuple for a trigram or quadgram table
+def cipher_counts(codes, model):
+    order = model_order(model)
+    if order == 2:
+        return bigram_counts(codes)
+    return ngram_counts(codes, order)
+
+
+# The flat positions in an n-gram table of the n-grams in `digits` once they are decrypted with key
+def _ngram_positions(digits, key):
+    return key[digits] @ len(alphabet) ** np.arange(digits.shape[1] - 1, -1, -1)
+
+
+# The plausibility score of the message decrypted with key, computed from the counts alone
+def key_score(counts, model, key):
+    if isinstance(counts, tuple):
+        digits, weights, contains = counts
+        return float(weights @ np.ravel(model)[_ngram_positions(digits, key)])
+    log_matrix = np.reshape(model, (len(alphabet), len(alphabet)))
+    return float((counts * log_matrix[np.ix_(key, key)]).sum())
+
+
+# The change in plausibility score if the plaintext characters given to cipher characters i and j are swapped.
+# For a bigram model, with p = key[i] and q = key[j], the bigrams starting with i or j change by
+# (counts[i] - counts[j]) . (log_matrix[q] - log_matrix[p])[key] and those ending with i or j by the same sum
+# over columns. Both sums also take in the four bigrams made only of i and j, which are corrected separately,
+# so a step costs a handful of 27 element operations and leaves key as it is.
+def swap_delta(counts, model, key, i, j):
+    if isinstance(counts, tuple):
+        swapped = key.copy()
+        swapped[i], swapped[j] = key[j], key[i]
+        digits, weights, contains = counts
+        rows = np.flatnonzero(contains[i] | contains[j])
+        table = np.ravel(model)
+        return float(weights[rows] @ (table[_ngram_positions(digits[rows], swapped)].astype(np.float64)
+                                      - table[_ngram_positions(digits[rows], key)]))
+    # A plain array view, as every operation on the memory mapped model would otherwise cost a few microseconds
+    log_matrix = np.asarray(model).reshape(len(alphabet), len(alphabet))
+    p, q = key[i], key[j]
+    cii, cij, cji, cjj = counts[i, i], counts[i, j], counts[j, i], counts[j, j]
+    lpp, lpq, lqp, lqq = log_matrix[p, p], log_matrix[p, q], log_matrix[q, p], log_matrix[q, q]
+    starting = (counts[i] - counts[j]) @ (log_matrix[q] - log_matrix[p])[key]
+    ending = (counts[:, i] - counts[:, j]) @ (log_matrix[:, q] - log_matrix[:, p])[key]
+    inside = ((cii - cji) * (lqp - lpp) + (cij - cjj) * (lqq - lpq)
+              + (cii - cij) * (lpq - lpp) + (cji - cjj) * (lqq - lqp))
+    return float(starting + ending - inside + (cii - cjj) * (lqq - lpp) + (cij - cji) * (lqp - lpq))
+
+
+# Simulated annealing over keys. By default the temperature schedule of metropolis_ext is followed: each
+# `step` iterations T is multiplied by a (a = 1 keeps T fixed as in metropolis). Another schedule, such as
+# schedules.AcceptanceSchedule, can be passed as schedule, in which case T, a and step are ignored. Two distinct
+# cipher characters are picked at random and their plaintext characters swapped, the swap is kept if it
+# improves the score, or otherwise with probability exp(delta/T). counts come from cipher_counts(codes, model).
+# An observer (such as telemetry.Telemetry) is told the current and best score, T and the number of accepted
+# swaps every observer.every steps and at the end. Returns the final key and its score.
+# A stopping rule (such as schedules.EarlyStop) can end the run before n_iter steps; it is checked every
+# schedule.every steps and is given the step number, the best score and the best key. As the run may then stop
+# while T is still high, the best key found and its score are returned instead of the final ones.
+def anneal(counts, model, key, T=10, a=0.01**(1/100), n_iter=10000, step=100, rng=random, observer=None,
+           schedule=None, stop=None):
+    if schedule is None:
+        schedule = GeometricSchedule(T, a, step)
+    schedule.start()
+    if stop is not None:
+        stop.start()
+    key = np.array(key)
+    score = best = key_score(counts, model, key)
+    best_key = key.copy()
+    accepted = 0
+    # The swaps made and tried since the schedule was last called. A swap of two cipher characters that are
+    # not in the message changes nothing, so its delta is exactly 0 and it is always made; such swaps are left
+    # out, or on a short message they would keep the acceptance rate up however low T fell.
+    window = 0
+    proposed = 0
+    every = 0
+    if observer is not None:
+        every = observer.every
+        observer.start(n_iter)
+    used = n_iter
+    for n in range(n_iter):
+        if n % schedule.every == 0:
+            if stop is not None and stop(n, best, best_key):
+                used = n
+                break
+            T = schedule(n, window / max(proposed, 1))
+            window = proposed = 0
+        if every and n % every == 0:
+            observer.record(n, score, best, T, accepted)
+            accepted = 0
+        # Picking two distinct cipher characters is the same as picking two distinct plaintext characters,
+        # as the key is a one to one mapping
+        i = rng.randrange(len(alphabet))
+        j = rng.randrange(len(alphabet) - 1)
+        if j >= i:
+            j += 1
+        delta = swap_delta(counts, model, key, i, j)
+        proposed += delta != 0
+        if delta > 0 or rng.random() <= math.exp(delta/T):
+            key[i], key[j] = key[j], key[i]
+            score += delta
+            accepted += 1
+            window += delta != 0
+            if score > best:
+                best = score
+                if stop is not None:
+                    best_key[:] = key
+    if observer is not None:
+        observer.record(used, score, best, T, accepted)
+    if stop is not None:
+        return best_key, best
+    return key, score
+
+
+# Anytime annealing for when there is a time limit rather than a number of steps. A generator that yields
+# (key, score, steps) first for the starting key and then every time the best score so far has improved
+# (checked every check_every steps), and finishes once `seconds` have passed, the time.monotonic() value
+# deadline is reached, or cancel.is_set() is true (cancel can be a threading.Event). T falls geometrically from T
+# to T_end over the time available instead of over a number of steps, so a short budget still cools all the
+# way down. The last key yielded is the best one found. The generator returns it too, with its score and the
+# total number of steps taken, which can be more than the steps of the last yield. The running score is a sum of
+# swap deltas, so it is rescored with key_score() every check_every steps, and a key is only yielded if it is a
+# different key whose rescored score is higher by more than rounding (so the scores yielded and returned are
+# exact and rise every time).
+def anneal_anytime(counts, model, key, seconds=None, deadline=None, cancel=None, T=10, T_end=0.1,
+                   check_every=100, rng=random):
+    started = time.monotonic()
+    if deadline is None:
+        if seconds is None:
+            raise ValueError('Either seconds or deadline must be given')
+        deadline = started + seconds
+    budget = max(deadline - started, 1e-9)
+    T0 = T
+    key = np.array(key)
+    score = best = key_score(counts, model, key)
+    best_key = key.copy()
+    reported, reported_key = best, best_key.copy()
+    n = 0
+    yield best_key.copy(), best, n
+    while True:
+        if not np.array_equal(best_key, reported_key):
+            best = key_score(counts, model, best_key)
+            if best > reported + 1e-9 * abs(reported):
+                reported, reported_key = best, best_key.copy()
+                yield best_key.copy(), best, n
+            else:
+                best, best_key[:] = reported, reported_key
+        now = time.monotonic()
+        if now >= deadline or cancel is not None and cancel.is_set():
+            break
+        T = T0 * (T_end / T0) ** min((now - started) / budget, 1)
+        for _ in range(check_every):
+            i = rng.randrange(len(alphabet))
+            j = rng.randrange(len(alphabet) - 1)
+            if j >= i:
+                j += 1
+            delta = swap_delta(counts, model, key, i, j)
+            if delta > 0 or rng.random() <= math.exp(delta/T):
+                key[i], key[j] = key[j], key[i]
+                score += delta
+                if score > best:
+                    best = score
+                    best_key[:] = key
+        n += check_every
+        score = key_score(counts, model, key)
+    return best_key, best, n
+
+
+# Runs anneal_anytime() to the end and returns the best key, its score and the number of steps taken
+def anneal_within(counts, model, key, seconds=None, deadline=None, cancel=None, **options):
+    steps = anneal_anytime(counts, model, key, seconds, deadline, cancel, **options)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as finished:
+            return finished.value
+
+
+# The languages worth annealing for a message, from its ranking by rank_languages(): the closest one, and the
+# next ones up to `top` languages if their distance is within margin of the closest (all `top` of them if margin
+# is None). The ranking alone is right for about two messages in three of 100 characters and 97 in 100 of 1000
+# characters, and when it is wrong the two distances are usually less than 0.05 apart.
+def close_languages(ranking, top=2, margin=0.05):
+    return [name for name, distance in ranking[:top] if margin is None or distance - ranking[0][1] < margin]
+
+
+# Decrypts an encoded message without being told its language. The languages of models (a dictionary of name:
+# bigram model) are first ranked with rank_languages(), then each of close_languages() is annealed from its own
+# frequency_key(). Keeping the more plausible result finds the language of about 9 in 10 messages of 100
+# characters and 19 in 20 of 200, while the second run is skipped for two thirds of messages of 1000
+# characters. Any other keyword arguments are passed on to anneal(). Returns the key with the highest
+# plausibility score, the name of its language, the score and the ranking.
+def solve_any_language(codes, models, top=2, margin=0.05, rng=random, **options):
+    ranking = rank_languages(codes, models)
+    best = None
+    for name in close_languages(ranking, top, margin):
+        log_matrix = models[name]['log']
+        key, score = anneal(cipher_counts(codes, log_matrix), log_matrix, frequency_key(codes, models[name]['unigram']),
+                            rng=rng, **options)
+        if best is None or score > best[2]:
+            best = key, name, score
+    return best + (ranking,)
+
+
+# Orders candidate keys for an encoded message, such as the final keys of several chains, from best to worst.
+# Scores within `tolerance` of the best one are treated as a tie and broken by word_hit_rate() with lexicon,
+# as a key can gain a little plausibility by turning real words into pronounceable fakes. Returns the indexes
+# of the keys in order.
+def rank_candidates(codes, keys, scores, lexicon, tolerance=5.0):
+    scores = np.asarray(scores, dtype=np.float64)
+    close = scores >= scores.max() - tolerance
+    hits = np.array([word_hit_rate(np.asarray(key)[codes], lexicon) if near else -1.0
+                     for key, near in zip(keys, close)])
+    return np.lexsort((-scores, -hits))
+
+
+# Scores every cyclic shift of many encoded messages at once. Shifting a message by s adds s (modulo 27) to
+# every index, so the score of shift s is sum over a,b of counts[a,b] * log_matrix[a+s, b+s]. The bigram counts
+# of all the messages are found with one bincount, and multiplied by the log matrix shifted all 27 ways in a
+# single matrix product. Returns an array with one row per message and one column per shift.
+def shift_scores(messages, model):
+    log_matrix = np.reshape(model, (len(alphabet), len(alphabet)))
+    size = len(alphabet)
+    shifted = (np.arange(size)[None, :] + np.arange(size)[:, None]) % size
+    # shifted_logs[s, a*27 + b] is log p of the bigram ab once it is shifted by s
+    shifted_logs = log_matrix[shifted[:, :, None], shifted[:, None, :]].reshape(size, size * size)
+    codes = np.concatenate([np.asarray(message, dtype=np.intp) for message in messages] + [np.zeros(0, np.intp)])
+    owner = np.repeat(np.arange(len(messages)), [len(message) for message in messages])
+    # Pairs made of the last character of one message and the first of the next are left out
+    same = owner[:-1] == owner[1:]
+    pairs = (owner[:-1] * size + codes[:-1]) * size + codes[1:]
+    counts = np.bincount(pairs[same], minlength=len(messages) * size * size).reshape(len(messages), size * size)
+    return counts @ shifted_logs.T
+
+
+# The shifts of every message ranked from the most to the least plausible. Returns the shifts and their scores
+# as two arrays with one row per message.
+def rank_shifts(messages, model):
+    scores = shift_scores(messages, model)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return order, np.take_along_axis(scores, order, axis=1)
+
+
+# Each worker process gets its own copy of the model once, when the pool starts, rather than having it sent
+# along with every chain
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _run_chain(counts, key, seed, options):
+    return anneal(counts, _worker_model, key, rng=random.Random(seed), **options)
+
+
+# Runs n_chains independent annealing chains from the same starting key on a pool of worker processes. Chain
+# n uses random.Random(seed + n), so a run can be repeated exactly. Any other keyword arguments (T, a,
+# n_iter, step) are passed on to anneal(). Returns the best key, its score and the final score of every chain.
+def parallel_anneal(counts, model, key, n_chains=None, seed=0, max_workers=None, **options):
+    if n_chains is None:
+        n_chains = os.cpu_count()
+    with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(model,)) as pool:
+        futures = [pool.submit(_run_chain, counts, key, seed + n, options) for n in range(n_chains)]
+        results = [future.result() for future in futures]
+    scores = [score for key, score in results]
+    best = int(np.argmax(scores))
+    return results[best][0], scores[best], scores
+
+
+def _replica_segment(counts, key, T, n_iter, seed, model=None):
+    if model is None:
+        model = _worker_model
+    return anneal(counts, model, key, T=T, a=1, n_iter=n_iter, step=n_iter, rng=random.Random(seed))
+
+
+# Replica exchange (parallel tempering). One replica of the key is annealed at each fixed temperature in
+# temperatures, all starting from key. Every exchange_every steps the replicas stop, and neighbouring pairs
+# (even pairs one round, odd pairs the next) swap keys with probability
+# min(1, exp((score_hot - score_cold) * (1/T_cold - 1/T_hot))), so good keys found by the hot replicas sink
+# down to the cold ones while the cold ones can climb out of a local optimum by way of the hot ones. The
+# replicas of a round run on a pool of worker processes, or in this process if max_workers is 1; the replica
+# at temperature r in round n uses random.Random('seed-n-r'), so the result does not depend on the number of
+# workers. n_iter is the number of steps of every replica. Returns the best key seen at the end of a round, its
+# score and the fraction of exchanges accepted between each pair of neighbouring temperatures, which should
+# not be close to 0 if the temperatures are well spread.
+def parallel_tempering(counts, model, key, temperatures=(0.2, 0.6, 1.7, 5), n_iter=5000,
+                       exchange_every=100, seed=0, max_workers=None):
+    temperatures = sorted(temperatures)
+    size = len(temperatures)
+    keys = [np.array(key) for T in temperatures]
+    scores = [key_score(counts, model, keys[0])] * size
+    best_key, best = keys[0].copy(), scores[0]
+    accepted = np.zeros(size - 1)
+    attempts = np.zeros(size - 1)
+    rng = random.Random(seed)
+    pool = None
+    if max_workers != 1:
+        pool = ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(model,))
+    with pool or nullcontext():
+        for n in range(max(n_iter // exchange_every, 1)):
+            seeds = ['%d-%d-%d' % (seed, n, r) for r in range(size)]
+            if pool is None:
+                results = [_replica_segment(counts, keys[r], temperatures[r], exchange_every, seeds[r], model)
+                           for r in range(size)]
+            else:
+                results = list(pool.map(_replica_segment, [counts] * size, keys, temperatures,
+                                        [exchange_every] * size, seeds))
+            keys = [key for key, score in results]
+            scores = [score for key, score in results]
+            top = int(np.argmax(scores))
+            if scores[top] > best:
+                best_key, best = keys[top].copy(), scores[top]
+            for r in range(n % 2, size - 1, 2):
+                attempts[r] += 1
+                x = (scores[r + 1] - scores[r]) * (1 / temperatures[r] - 1 / temperatures[r + 1])
+                if x >= 0 or rng.random() < math.exp(x):
+                    keys[r], keys[r + 1] = keys[r + 1], keys[r]
+                    scores[r], scores[r + 1] = scores[r + 1], scores[r]
+                    accepted[r] += 1
+    return best_key, best, accepted / np.maximum(attempts, 1)
+
+
+# The part of the score that comes from rows i and j and columns i and j of the counts matrix, for many keys at
+# once: keys has one key per row, and rows holds the two cipher characters i and j for each of them. The four
+# entries where these rows and columns cross are subtracted once as they appear in both sums.
+def _batched_touched_score(counts, log_matrix, keys, rows):
+    chains = np.arange(len(keys))[:, None]
+    plain = keys[chains, rows]
+    # log p of the bigrams of row i and j (cipher characters i, j followed by anything), of column i and j,
+    # and of the four entries where they cross
+    row_logs = log_matrix[plain[:, :, None], keys[:, None, :]]
+    column_logs = log_matrix[keys[:, :, None], plain[:, None, :]]
+    cross_logs = log_matrix[plain[:, :, None], plain[:, None, :]]
+    return ((counts[rows] * row_logs).sum(axis=(1, 2))
+            + (counts.T[rows].transpose(0, 2, 1) * column_logs).sum(axis=(1, 2))
+            - (counts[rows[:, :, None], rows[:, None, :]] * cross_logs).sum(axis=(1, 2)))
+
+
+# swap_delta() for many keys at once, each with its own pair of cipher characters i[k], j[k]
+def batched_swap_deltas(counts, log_matrix, keys, i, j):
+    chains = np.arange(len(keys))
+    swapped = keys.copy()
+    swapped[chains, i], swapped[chains, j] = keys[chains, j], keys[chains, i]
+    rows = np.stack([i, j], axis=1)
+    return (_batched_touched_score(counts, log_matrix, swapped, rows)
+            - _batched_touched_score(counts, log_matrix, keys, rows))
+
+
+# Runs n_chains annealing chains in lock step in this process. The keys are the rows of one (n_chains, 27)
+# array; every step a pair of cipher characters is drawn for every chain in one call, all the score changes
+# are found with batched_swap_deltas(), and the accepted swaps are made with a mask, so the cost of the Python
+# loop is shared by all the chains. key is either one key, which every chain starts from, or one key per
+# chain. All the chains follow the same schedule (that of metropolis_ext unless schedule is given, which is
+# told the fraction of accepted swaps over all the chains). The random numbers come from np.random.default_rng(seed). Only
+# bigram models are supported. Returns the final keys and their scores.
+def batched_anneal(counts, model, key, n_chains=32, T=10, a=0.01**(1/100), n_iter=10000, step=100, seed=0,
+                   schedule=None):
+    if isinstance(counts, tuple):
+        raise ValueError('batched_anneal only works with a bigram model')
+    log_matrix = np.reshape(model, (len(alphabet), len(alphabet)))
+    keys = np.array(np.broadcast_to(key, (n_chains, len(alphabet))))
+    scores = (counts * log_matrix[keys[:, :, None], keys[:, None, :]]).sum(axis=(1, 2))
+    if schedule is None:
+        schedule = GeometricSchedule(T, a, step)
+    schedule.start()
+    rng = np.random.default_rng(seed)
+    chains = np.arange(n_chains)
+    # As in anneal(), swaps that change nothing (delta exactly 0) are left out of the acceptance rate
+    window = 0
+    proposed = 0
+    for n in range(n_iter):
+        if n % schedule.every == 0:
+            T = schedule(n, window / max(proposed, 1))
+            window = proposed = 0
+        i = rng.integers(len(alphabet), size=n_chains)
+        j = rng.integers(len(alphabet) - 1, size=n_chains)
+        j += j >= i
+        deltas = batched_swap_deltas(counts, log_matrix, keys, i, j)
+        with np.errstate(over='ignore'):
+            accept = (deltas > 0) | (rng.random(n_chains) <= np.exp(deltas / T))
+        moved = chains[accept]
+        keys[moved, i[accept]], keys[moved, j[accept]] = keys[moved, j[accept]], keys[moved, i[accept]]
+        scores[accept] += deltas[accept]
+        window += np.count_nonzero(accept & (deltas != 0))
+        proposed += np.count_nonzero(deltas)
+    return keys, scores
+
+
+# The score change of every one of the 27*26/2 = 351 swaps of two cipher characters, worked out at once.
+# Returns the arrays i, j and deltas, where deltas[n] is the change if the plaintext characters of cipher
+# characters i[n] and j[n] are swapped.
+def all_swap_deltas(counts, model, key):
+    key = np.asarray(key)
+    i, j = np.triu_indices(len(alphabet), 1)
+    keys = np.repeat(key[None, :], len(i), axis=0)
+    if isinstance(counts, tuple):
+        digits, weights, contains = counts
+        swapped = keys.copy()
+        pairs = np.arange(len(i))
+        swapped[pairs, i], swapped[pairs, j] = key[j], key[i]
+        table = np.ravel(model)
+        powers = len(alphabet) ** np.arange(digits.shape[1] - 1, -1, -1)
+        scores = table[swapped[:, digits] @ powers].astype(np.float64) @ weights
+        return i, j, scores - key_score(counts, model, key)
+    log_matrix = np.reshape(model, (len(alphabet), len(alphabet)))
+    return i, j, batched_swap_deltas(counts, log_matrix, keys, i, j)
+
+
+# Steepest ascent: makes the swap with the largest score increase, as found by all_swap_deltas(), until no
+# swap improves the score (or max_steps swaps have been made). Meant for polishing a key that is nearly right,
+# such as the result of anneal(), as it only ever climbs to the nearest local optimum. Returns the key, its
+# score and the number of swaps made.
+def steepest_ascent(counts, model, key, max_steps=None):
+    key = np.array(key)
+    score = key_score(counts, model, key)
+    steps = 0
+    while max_steps is None or steps < max_steps:
+        i, j, deltas = all_swap_deltas(counts, model, key)
+        best = int(np.argmax(deltas))
+        if deltas[best] <= 1e-9:
+            break
+        key[i[best]], key[j[best]] = key[j[best]], key[i[best]]
+        score += deltas[best]
+        steps += 1
+    return key, score, steps
@@ -0,0 +1,70 @@
+# Records what happens during an annealing run.
+# A Telemetry object is passed to solvers.anneal() as its observer. Every `every` steps anneal() hands it the
+# current and best score, the temperature and how many swaps were accepted, which are stored in arrays that are
+# allocated once at the start of the run, together with the steps per second since the last sample. Phases of
+# the work (loading the model, the initial guess, the annealing) can also be timed with phase(). When no
+# observer is passed, anneal() does no extra work apart from counting the accepted swaps.
+
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# The columns of a sample, in the order they are exported
+columns = ['step', 'score', 'best', 'temperature', 'acceptance', 'steps_per_second']
+
+
+class Telemetry:
+
+    def __init__(self, every=100):
+        self.every = every
+        self.phases = {}
+        self.samples = np.zeros((0, len(columns)))
+        self.size = 0
+
+    # Called by anneal() before the first step, so the arrays can be allocated for the whole run
+    def start(self, n_iter):
+        self.samples = np.zeros((n_iter // self.every + 2, len(columns)))
+        self.size = 0
+        self._last_step = 0
+        self._last_time = time.perf_counter()
+
+    # Called by anneal() every `every` steps and once at the end, with the number of swaps accepted since the
+    # previous call
+    def record(self, step, score, best, T, accepted):
+        now = time.perf_counter()
+        steps = step - self._last_step
+        if self.size == len(self.samples):
+            self.samples = np.concatenate([self.samples, np.zeros_like(self.samples)])
+        self.samples[self.size] = (step, score, best, T, accepted / steps if steps else 0,
+                                   steps / (now - self._last_time) if now > self._last_time else 0)
+        self.size += 1
+        self._last_step, self._last_time = step, now
+
+    # Times the code inside a with block, adding it to the total for the phase called name
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - started
+
+    def to_dict(self):
+        samples = {name: self.samples[:self.size, n].tolist() for n, name in enumerate(columns)}
+        samples['step'] = [int(step) for step in samples['step']]
+        return {'phases': dict(self.phases), 'samples': samples}
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    # Writes one row per sample; the phase timings are not included
+    def to_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in self.samples[:self.size].tolist():
+                writer.writerow([int(row[0])] + row[1:])
@@ -0,0 +1,101 @@
+# Periodic (Vigenère) ciphers over the same 27 character alphabet.
+# The character at position t is shifted by the key shift s[t % period] (as in Section 1, the plaintext index
+# is the cipher index plus the shift, modulo 27). Two positions a multiple of the period apart are shifted by
+# the same amount, so they hold the same cipher character as often as two positions of the plaintext do, which
+# for English is about twice as often as for random text. The fraction of matching positions at every lag is
+# found at once from the autocorrelation of the message, computed with an FFT. Once the period is known each
+# column of the message (every period-th character) is a simple shift, which is first solved from its
+# character counts and then improved with the bigrams that join it to its neighbouring columns.
+
+import numpy as np
+
+from .language_model import alphabet
+
+# Every shift s of every index a, (a + s) % 27, as a 27 by 27 array with one row per shift
+_shifted = (np.arange(len(alphabet))[:, None] + np.arange(len(alphabet))[None, :]) % len(alphabet)
+
+
+# The fraction of positions t for which codes[t] == codes[t + lag], for every lag from 1 to max_lag. The
+# autocorrelation of the one hot encoding of the message is summed over the 27 characters; padding the FFT to
+# twice the length of the message keeps it from wrapping around.
+def coincidence_rates(codes, max_lag):
+    codes = np.asarray(codes)
+    size = 1 << (2 * len(codes) - 1).bit_length()
+    one_hot = np.zeros((len(alphabet), len(codes)))
+    one_hot[codes, np.arange(len(codes))] = 1
+    spectrum = np.fft.rfft(one_hot, size, axis=1)
+    matches = np.fft.irfft((spectrum * spectrum.conj()).real.sum(axis=0), size)
+    lags = np.arange(1, min(max_lag, len(codes) - 1) + 1)
+    return np.rint(matches[lags]) / (len(codes) - lags)
+
+
+# Scores every period from 1 to max_period by the mean coincidence rate over the lags that are multiples of
+# it. Returns the periods from the most to the least likely, and their scores in the same order.
+def rank_periods(codes, max_period=20):
+    rates = coincidence_rates(codes, 4 * max_period)
+    periods = np.arange(1, min(max_period, len(rates)) + 1)
+    scores = np.array([rates[period - 1::period].mean() for period in periods])
+    order = np.argsort(-scores, kind='stable')
+    return periods[order], scores[order]
+
+
+# The most likely period. A multiple of the period scores about as well as the period itself, so the
+# shortest period whose score is at least `share` of the way from the rate of random text (1/27) to the best
+# score is chosen. A divisor d of the period p only scores about d/p of the way, which is a half for p/2, so
+# share is a little more than that. If even the best score is below the rate of random text the best period is
+# taken, and a message too short to have a coincidence rate is taken to be a plain shift (period 1). On
+# passages of Moby Dick and The Count of Monte Cristo with random periods from 1 to 11 this finds the period
+# three times out of four from 100 characters, nine times out of ten from 200 and 24 times out of 25 from 400.
+def key_length(codes, max_period=20, share=0.6):
+    periods, scores = rank_periods(codes, max_period)
+    if not len(periods):
+        return 1
+    threshold = min(1 / len(alphabet) + share * (scores[0] - 1 / len(alphabet)), scores[0])
+    return int(periods[scores >= threshold].min())
+
+
+# The shift of every column of the message for the given period. model is a record made by
+# language_model.model_from_counts() (such as load_model(path)). Each column is given the shift that makes
+# its characters most likely under the unigram frequencies, all columns and shifts scored with one matrix
+# product; then, until nothing changes, each column in turn is given the shift that scores best with the
+# bigrams across its boundaries with the columns before and after it. Returns the shifts.
+def column_shifts(codes, period, model, max_rounds=10):
+    codes = np.asarray(codes)
+    size = len(alphabet)
+    log_unigram = np.log(model['unigram'] / model['unigram'].sum())
+    log_matrix = model['log']
+    columns = np.arange(len(codes)) % period
+    column_counts = np.bincount(columns * size + codes, minlength=period * size).reshape(period, size)
+    # column_counts @ log_unigram[_shifted].T scores column j shifted by s
+    shifts = np.argmax(column_counts @ log_unigram[_shifted].T, axis=1)
+    if period == 1 or len(codes) < 2:
+        return shifts
+    # pair_counts[j, a, b] counts the positions where character a in column j - 1 is followed by b in column j
+    pair_counts = np.bincount((columns[1:] * size + codes[:-1]) * size + codes[1:],
+                              minlength=period * size * size).reshape(period, size, size)
+    for _ in range(max_rounds):
+        changed = False
+        for j in range(period):
+            before, after = (j - 1) % period, (j + 1) % period
+            # The score of the bigrams into column j and out of it, for every shift of column j at once
+            scores = ((pair_counts[j] * log_matrix[_shifted[shifts[before]][:, None], _shifted[:, None, :]])
+                      .sum(axis=(1, 2))
+                      + (pair_counts[after] * log_matrix[_shifted[:, :, None], _shifted[shifts[after]][None, None, :]])
+                      .sum(axis=(1, 2)))
+            best = int(np.argmax(scores))
+            if best != shifts[j]:
+                shifts[j] = best
+                changed = True
+        if not changed:
+            break
+    return shifts
+
+
+# Decrypts an encoded periodic cipher: finds the period with key_length() unless it is given, and the shift
+# of every column with column_shifts(). Returns the decrypted codes, the period and the shifts.
+def solve_vigenere(codes, model, period=None, max_period=20):
+    codes = np.asarray(codes)
+    if period is None:
+        period = key_length(codes, max_period)
+    shifts = column_shifts(codes, period, model)
+    return (codes + shifts[np.arange(len(codes)) % period]) % len(alphabet), period, shifts